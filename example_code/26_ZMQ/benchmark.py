@@ -0,0 +1,111 @@
+""" Compares sending frames pickled (send_pyobj) and as raw buffers (frames.py).
+
+The publisher sends the same frames with both methods to a few subscribers,
+each in its own process. Subscribers only receive the frames, so what is
+measured is the cost of the transport: frames per second, and the CPU time
+spent per frame by the publisher and by each subscriber.
+
+    python benchmark.py [--frames 300] [--subscribers 3] [--shape 480 640 3]
+"""
+import argparse
+import multiprocessing as mp
+from time import perf_counter, process_time, sleep
+
+import numpy as np
+import zmq
+
+from frames import recv_frame, send_frame, send_stop
+
+PORT = 5566
+
+
+def subscriber(method, port, ready, results):
+    context = zmq.Context()
+    with context.socket(zmq.SUB) as socket:
+        socket.setsockopt(zmq.RCVHWM, 0)  # Keep every frame, nothing is dropped
+        socket.connect(f"tcp://localhost:{port}")
+        socket.setsockopt(zmq.SUBSCRIBE, b'frame')
+        ready.set()
+        i = 0
+        t0 = perf_counter()
+        cpu0 = process_time()
+        while True:
+            if method == 'pickle':
+                socket.recv_string()
+                data = socket.recv_pyobj()
+                if isinstance(data, str):
+                    break
+            else:
+                topic, header, data = recv_frame(socket)
+                if data is None:
+                    break
+            if i == 0:
+                # Timing starts with the first frame, not while waiting for it
+                t0 = perf_counter()
+                cpu0 = process_time()
+            i += 1
+        elapsed = perf_counter() - t0
+        cpu = process_time() - cpu0
+    context.term()
+    # The first frame is not part of the time measured
+    results.put((max(i - 1, 0), elapsed, cpu))
+
+
+def publish(method, frames, count, subscribers):
+    """ Sends count frames to subscribers processes, returns the statistics of all the processes."""
+    results = mp.Queue()
+    events = [mp.Event() for _ in range(subscribers)]
+    processes = [mp.Process(target=subscriber, args=(method, PORT, event, results)) for event in events]
+    context = zmq.Context()
+    with context.socket(zmq.PUB) as socket:
+        socket.setsockopt(zmq.SNDHWM, 0)
+        socket.bind(f"tcp://*:{PORT}")
+        for process in processes:
+            process.start()
+        for event in events:
+            event.wait()
+        sleep(1)  # Subscriptions reach the publisher a bit after connecting
+
+        cpu0 = process_time()
+        for i in range(count):
+            frame = frames[i % len(frames)]
+            if method == 'pickle':
+                socket.send_string('frame', zmq.SNDMORE)
+                socket.send_pyobj(frame)
+            else:
+                send_frame(socket, 'frame', frame, i)
+        publisher_cpu = process_time() - cpu0
+        if method == 'pickle':
+            socket.send_string('frame', zmq.SNDMORE)
+            socket.send_pyobj('stop')
+        else:
+            send_stop(socket, 'frame')
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    context.term()
+    return publisher_cpu, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Frames per second and CPU use of pickled and raw frames.')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--subscribers', type=int, default=3)
+    parser.add_argument('--shape', type=int, nargs='+', default=[480, 640, 3])
+    args = parser.parse_args()
+
+    # A few different frames, as a camera would produce
+    frames = [np.random.randint(0, 256, args.shape, dtype=np.uint8) for _ in range(10)]
+    size = frames[0].nbytes / 2**20
+    print(f'{args.frames} frames of {size:.2f} MB to {args.subscribers} subscribers')
+    print(f'{"method":>8} {"frames/s":>10} {"sub CPU ms/frame":>17} {"pub CPU ms/frame":>17}')
+    for method in ('pickle', 'raw'):
+        publisher_cpu, stats = publish(method, frames, args.frames, args.subscribers)
+        stats = [s for s in stats if s[0]]
+        rate = np.mean([count / elapsed for count, elapsed, cpu in stats])
+        cpu = np.mean([1000 * cpu / count for count, elapsed, cpu in stats])
+        print(f'{method:>8} {rate:>10.1f} {cpu:>17.3f} {1000 * publisher_cpu / args.frames:>17.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,20 @@ class Camera:
         while not self.stop_movie:
             queue.put({'topic': 'frame', 'data':self.get_frame()})
 
+    def acquire_to_ring(self, ring):
+        """ Acquires frames straight into the slots of a ring_buffer.FrameRing, without copying them."""
+        self.stop_movie = False
+        while not self.stop_movie:
+            index, slot = ring.claim()
+            ret, frame = self.cap.read(slot)  # OpenCV fills the slot in place
+            if not ret:
+                continue
+            if frame is not slot:
+                # OpenCV allocates a new array when the slot does not fit the frame
+                slot[...] = frame
+            ring.commit(index)
+        ring.finish()
+
     def set_brightness(self, value):
         self.cap.set(cv2.CAP_PROP_BRIGHTNESS, value)
 
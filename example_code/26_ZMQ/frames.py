@@ -0,0 +1,67 @@
+""" Sending numpy frames through ZMQ without pickling them.
+
+A frame travels as a multipart message of three parts:
+
+    topic | header | raw buffer
+
+The header is a small JSON object with the dtype, the shape, the index of the
+frame and the time it was acquired. The buffer is the memory of the array
+itself, handed to ZMQ with ``copy=False``, and the subscribers rebuild the
+array on top of the received message with ``np.frombuffer``, without copying
+it either. Compared to ``send_pyobj``/``recv_pyobj``, the frame is never
+pickled by the publisher nor unpickled by each of the subscribers.
+
+Two things to keep in mind:
+
+* With ``copy=False``, ZMQ may still be reading the array after ``send``
+  returns. The publisher must not modify a frame it has sent, which is the
+  case when every frame is a new array.
+* The arrays received are read-only views on the message. Use
+  ``frame.copy()`` to modify them.
+"""
+import json
+from time import time
+
+import numpy as np
+import zmq
+
+
+def send_frame(socket, topic, frame, index, timestamp=None):
+    """ Publishes a frame as topic, header and raw buffer.
+
+    :param zmq.Socket socket: socket to send the frame through
+    :param str topic: topic of the message
+    :param np.ndarray frame: image to send
+    :param int index: number of the frame, to detect the frames that were dropped
+    :param float timestamp: time at which the frame was acquired, now by default
+    """
+    frame = np.ascontiguousarray(frame)
+    header = {
+        'dtype': frame.dtype.str,
+        'shape': frame.shape,
+        'index': index,
+        'timestamp': time() if timestamp is None else timestamp,
+    }
+    socket.send_string(topic, zmq.SNDMORE)
+    socket.send_json(header, zmq.SNDMORE)
+    socket.send(frame, copy=False)
+
+
+def send_stop(socket, topic):
+    """ Tells the subscribers that no more frames will come."""
+    socket.send_string(topic, zmq.SNDMORE)
+    socket.send_json({'stop': True}, zmq.SNDMORE)
+    socket.send(b'')
+
+
+def recv_frame(socket):
+    """ Receives a message sent with send_frame or send_stop.
+
+    :return: topic, header and frame. The frame is None for the stop message.
+    """
+    topic, header, buffer = socket.recv_multipart(copy=False)
+    header = json.loads(header.bytes)
+    if header.get('stop'):
+        return topic.bytes.decode('utf-8'), header, None
+    frame = np.frombuffer(buffer.buffer, dtype=header['dtype']).reshape(header['shape'])
+    return topic.bytes.decode('utf-8'), header, frame
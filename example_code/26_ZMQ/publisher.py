@@ -1,6 +1,8 @@
 import zmq
 from time import sleep
 
+from frames import send_frame, send_stop
+
 
 def publisher(queue, event, port):
     """ Simple method that starts a publisher on the port 5555.
@@ -12,13 +14,51 @@ def publisher(queue, event, port):
     """
     port_pub = port
     context = zmq.Context()
+    index = 0
     with context.socket(zmq.PUB) as socket:
         socket.bind("tcp://*:%s" % port_pub)
         while not event.is_set():
             while not queue.empty():
                 data = queue.get()  # Should be a dictionary {'topic': topic, 'data': data}
-                socket.send_string(data['topic'], zmq.SNDMORE)
-                socket.send_pyobj(data['data'])
+                if isinstance(data['data'], str):  # 'stop'
+                    send_stop(socket, data['topic'])
+                else:
+                    # Header and raw buffer, the frame is not pickled again
+                    send_frame(socket, data['topic'], data['data'], index, data.get('timestamp'))
+                    index += 1
         sleep(0.005)  # Sleeps 5 milliseconds to be polite with the CPU
         sleep(1)  # Gives enough time to the subscribers to update their status
     print('Finished publisher')
+
+
+def ring_publisher(ring, event, port, topic='frame'):
+    """ Publishes the frames of a ring buffer filled by the camera.
+
+    Frames cross from the camera to this process through shared memory, and
+    are copied once out of their slot, so the camera can reuse it while ZMQ
+    sends the frame.
+
+    :param ring_buffer.FrameRing ring: ring buffer the camera writes to
+    :param multiprocessing.Event event: Event to stop the publisher
+    :param int port: port in which to broadcast data
+    :param str topic: topic of the frames
+    """
+    context = zmq.Context()
+    with context.socket(zmq.PUB) as socket:
+        socket.bind("tcp://*:%s" % port)
+        stopped = False
+        while not event.is_set():
+            index, frame = ring.read()
+            if frame is not None:
+                send_frame(socket, topic, frame, index)
+                continue
+            if ring.finished and not stopped:
+                # The last frames may have been committed after read() returned
+                if ring.cursor < ring.written:
+                    continue
+                send_stop(socket, topic)
+                stopped = True
+            sleep(0.001)  # Nothing new, wait for the camera
+        sleep(1)  # Gives enough time to the subscribers to update their status
+    print(f'Finished publisher: {ring.read_frames} frames sent, {ring.overruns} lost to overruns')
+    ring.close()
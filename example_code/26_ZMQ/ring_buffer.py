@@ -0,0 +1,192 @@
+""" Ring buffer of frames in shared memory, to pass frames between processes without pickling them.
+
+The buffer is a block of ``multiprocessing.shared_memory`` holding a fixed
+number of slots, each one the size of a frame, preceded by a small header:
+
+    written | finished | sequence of slot 0 | ... | sequence of slot n-1 | frames
+
+The camera (the only writer) claims the slot of the next frame, writes the
+frame in place, for instance with ``cap.read(slot)``, and commits it. Readers
+in any process keep their own position and read the frames by their index:
+frame ``i`` lives in slot ``i % slots`` until it is overwritten by frame
+``i + slots``. The writer never waits for the readers. A reader that falls
+more than ``slots`` frames behind skips to the oldest frame still available,
+and counts the frames it lost as overruns.
+
+Every slot stores the index of the frame it holds, and -1 while it is being
+written. A reader checks it before and after copying a frame, so a frame that
+was overwritten while being copied is detected and counted as an overrun as
+well.
+
+The ring can be passed to a Process as an argument, the child attaches to the
+same memory::
+
+    ring = FrameRing(frame.shape, frame.dtype, slots=32)
+    Process(target=consumer, args=(ring,)).start()
+    ...
+    ring.close()
+    ring.unlink()  # Only in the process that created it
+
+Only the process that created the ring unlinks it. Before Python 3.13,
+attaching to shared memory registers it with the resource tracker of the
+process as if it had created it, and the tracker unlinks it at exit. Rings
+attached by name are kept out of the tracker, so a reader that exits does not
+remove the memory under the camera.
+"""
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# written, finished
+HEADER_FIELDS = 2
+ALIGNMENT = 64
+
+
+def attach(name):
+    """ Attaches to the shared memory called name, without registering it with the resource tracker."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Unregistering afterwards would also drop the registration of the creator
+    # when both processes share the tracker, as processes started by
+    # multiprocessing do, so the registration is skipped instead
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+class FrameRing:
+    def __init__(self, shape, dtype, slots=32, name=None):
+        """ Creates a ring buffer, or attaches to the existing one called name.
+
+        :param tuple shape: shape of the frames
+        :param dtype: data type of the frames
+        :param int slots: number of frames the buffer holds
+        :param str name: name of the shared memory to attach to, None to create a new one
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        header_size = 8 * (HEADER_FIELDS + slots)
+        self.offset = -(-header_size // ALIGNMENT) * ALIGNMENT
+        frame_size = int(np.prod(self.shape)) * self.dtype.itemsize
+        size = self.offset + slots * frame_size
+
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = attach(name)
+        self.header = np.ndarray((HEADER_FIELDS + slots,), dtype=np.int64, buffer=self.memory.buf)
+        self.sequences = self.header[HEADER_FIELDS:]
+        self.frames = np.ndarray((slots,) + self.shape, dtype=self.dtype, buffer=self.memory.buf,
+                                 offset=self.offset)
+        if self.owner:
+            self.header[:] = 0
+            self.sequences[:] = -1
+
+        # Position of this reader, the frames it lost and the ones it read
+        self.cursor = 0
+        self.overruns = 0
+        self.read_frames = 0
+
+    def __reduce__(self):
+        # Processes get a ring attached to the same memory, not a copy
+        return FrameRing, (self.shape, self.dtype.str, self.slots, self.memory.name)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def written(self):
+        """ Number of frames committed so far, the index of the next one."""
+        return int(self.header[0])
+
+    @property
+    def finished(self):
+        return bool(self.header[1])
+
+    # Writer side
+
+    def claim(self):
+        """ Returns the index of the next frame and the slot to write it into."""
+        index = self.written
+        slot = index % self.slots
+        self.sequences[slot] = -1
+        return index, self.frames[slot]
+
+    def commit(self, index):
+        """ Makes the frame written into its slot available to the readers."""
+        self.sequences[index % self.slots] = index
+        self.header[0] = index + 1
+
+    def put(self, frame):
+        """ Copies a frame into the next slot. Returns its index."""
+        index, slot = self.claim()
+        slot[...] = frame
+        self.commit(index)
+        return index
+
+    def finish(self):
+        """ Tells the readers that no more frames will be written."""
+        self.header[1] = 1
+
+    # Reader side
+
+    def get(self, index):
+        """ Returns a view on the frame index, or None if it is not available (yet or anymore).
+
+        The view is only valid until the writer reuses the slot, copy it to keep it.
+        """
+        if self.sequences[index % self.slots] != index:
+            return None
+        return self.frames[index % self.slots]
+
+    def latest(self):
+        """ Returns (index, copy) of the last frame written, or (None, None)."""
+        index = self.written - 1
+        if index < 0:
+            return None, None
+        frame = self.get(index)
+        if frame is None:
+            return None, None
+        frame = frame.copy()
+        if self.sequences[index % self.slots] != index:
+            return None, None
+        return index, frame
+
+    def read(self):
+        """ Returns (index, copy) of the next frame of this reader, or (None, None) if there is no new frame.
+
+        Frames overwritten before being read are skipped and added to overruns.
+        """
+        while True:
+            written = self.written
+            if self.cursor >= written:
+                return None, None
+            oldest = written - self.slots + 1  # The slot of written - slots may be being rewritten
+            if self.cursor < oldest:
+                self.overruns += oldest - self.cursor
+                self.cursor = oldest
+            index = self.cursor
+            self.cursor += 1
+            frame = self.get(index)
+            if frame is not None:
+                frame = frame.copy()
+                # Still the same frame after copying it, it was not overwritten meanwhile
+                if self.sequences[index % self.slots] == index:
+                    self.read_frames += 1
+                    return index, frame
+            self.overruns += 1
+
+    def close(self):
+        # The arrays point to the memory, they have to go before it is closed
+        self.header = self.sequences = self.frames = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
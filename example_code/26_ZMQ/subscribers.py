@@ -3,6 +3,8 @@ from time import sleep
 import numpy as np
 import zmq
 
+from frames import recv_frame
+
 
 def save_movie(port, topic, frame_shape, dtype):
     f = h5py.File('movie.hdf5', 'w')
@@ -15,9 +17,8 @@ def save_movie(port, topic, frame_shape, dtype):
         socket.setsockopt(zmq.SUBSCRIBE, ''.encode('utf-8'))
         i = 0
         while True:
-            topic = socket.recv_string()
-            data = socket.recv_pyobj()  # flags=0, copy=True, track=False)
-            if isinstance(data, str):
+            topic, header, data = recv_frame(socket)
+            if data is None:
                 break
             dset[:,:,:,i] = data
             i += 1
@@ -39,9 +40,8 @@ def analyze_frames(port, topic, event):
         max = []
         avg = []
         while True:
-            topic = socket.recv_string()
-            data = socket.recv_pyobj()  # flags=0, copy=True, track=False)
-            if isinstance(data, str):
+            topic, header, data = recv_frame(socket)
+            if data is None:
                 break
             data = np.sum(data, 2)
             min.append(np.min(data))
@@ -64,9 +64,8 @@ def slow_subscriber(port, topic):
         socket.setsockopt(zmq.SUBSCRIBE, ''.encode('utf-8'))
         i = 0
         while True:
-            topic = socket.recv_string()
-            data = socket.recv_pyobj()  # flags=0, copy=True, track=False)
-            if isinstance(data, str):
+            topic, header, data = recv_frame(socket)
+            if data is None:
                 break
             i += 1
             sleep(.5)
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Asset Bundler
+-------------
+
+Concatenates the theme scripts and stylesheets that each page loads into
+bundles, so a page pays one request per group instead of one per file.
+
+Every written page is scanned, in the pass of ``html_pipeline``, for runs of
+consecutive local ``<script src="...theme/js/..."></script>`` tags (and
+``<link rel="stylesheet" href="...theme/css/...">`` tags). Each run of two
+files or more is replaced by a single tag pointing at ``theme/js/bundle.<hash>.js`` (or
+``theme/css/bundle.<hash>.css``). Runs are broken by inline or external
+scripts, so the execution order of the page is preserved. Since templates of
+the same type load the same files, pages of the same type end up sharing the
+same bundles.
+
+Files are minified with the pure-Python `rjsmin` and `rcssmin` packages when
+they are installed (files ending in ``.min.js``/``.min.css`` are taken as they
+are) and a source map pointing each line of the bundle back to its source file
+is written next to it.
+
+The bundle name is the hash of its inputs, which also works as a cache key:
+bundles are stored in ``CACHE_PATH/bundles`` and only rebuilt when one of
+their files changes. Once the site is written, the bundles of the output that
+no page refers to anymore are removed.
+
+Settings:
+
+* ``BUNDLE_MINIFY``: minify the bundles, defaults to True
+* ``BUNDLE_SOURCE_MAPS``: write source maps, defaults to True
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+from pelican import signals
+from pelican.plugins._utils import load_legacy_plugin
+
+pipeline = load_legacy_plugin('html_pipeline', [os.path.dirname(os.path.realpath(__file__))])
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate the cached bundles when the bundling logic changes
+BUNDLE_VERSION = '1'
+HASH_LENGTH = 8
+
+_script_re = re.compile(r'<script\s+src="([^"]+)"\s*>\s*</script>')
+_link_re = re.compile(r'<link\s+(?:href="([^"]+)"\s+rel="stylesheet"|rel="stylesheet"\s+href="([^"]+)")\s*/?>')
+# Names already fingerprinted by the asset_fingerprint plugin
+_hashed_re = re.compile(r'^(.+)\.[0-9a-f]{%d}(\.[^.]+)$' % HASH_LENGTH)
+_bundle_re = re.compile(r'^(bundle\.[0-9a-f]{%d}\.(?:js|css))(?:\.map)?$' % HASH_LENGTH)
+
+# The bundle gets its own source map, the ones of the inputs would point nowhere
+_source_map_re = re.compile(r'^\s*(?://|/\*)# sourceMappingURL=.*$', re.MULTILINE)
+
+_base64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+def vlq_encode(value):
+    """ Base64 VLQ encoding used by the source maps mappings."""
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    encoded = ''
+    while True:
+        digit = value & 31
+        value >>= 5
+        if value:
+            digit |= 32
+        encoded += _base64[digit]
+        if not value:
+            return encoded
+
+
+def source_map(bundle_name, sources, line_counts):
+    """ Maps every line of the bundle to the file it comes from.
+
+    Minification does not keep track of positions, so the mapping has file
+    granularity: line ``n`` of a file maps to line ``n`` of its source, or to its
+    last line when minification joined several lines into one.
+    """
+    mappings = []
+    previous_source = 0
+    previous_line = 0
+    for index, (name, (generated, original)) in enumerate(zip(sources, line_counts)):
+        for line in range(generated):
+            target = min(line, original - 1)
+            mappings.append('A' + vlq_encode(index - previous_source) + vlq_encode(target - previous_line) + 'A')
+            previous_source, previous_line = index, target
+    return {
+        'version': 3,
+        'file': bundle_name,
+        'sources': sources,
+        'names': [],
+        'mappings': ';'.join(mappings),
+    }
+
+
+def minify(kind, name, text):
+    """ Returns the minified text, or the text itself if no minifier is available."""
+    if name.endswith('.min.' + kind):
+        return text
+    try:
+        if kind == 'js':
+            from rjsmin import jsmin
+            return jsmin(text)
+        from rcssmin import cssmin
+        return cssmin(text)
+    except ImportError:
+        logger.warning('asset_bundler: install rjsmin and rcssmin to minify the bundles')
+        return text
+
+
+class Bundler(object):
+
+    def __init__(self):
+        self.settings = {}
+        self.hashes = {}
+        self.built = set()
+        # {page path: bundles it loads}, kept across the builds of the dev server,
+        # which only writes some of the pages
+        self.used = {}
+
+    def initialize(self, generators):
+        settings = generators[0].settings
+        self.settings = settings
+        self.output_path = generators[0].output_path
+        self.static_dir = settings.get('THEME_STATIC_DIR', 'theme')
+        self.source_dir = os.path.join(settings['THEME'], 'static')
+        self.cache_dir = os.path.join(settings.get('CACHE_PATH', 'cache'), 'bundles')
+        self.minify = settings.get('BUNDLE_MINIFY', True)
+        self.source_maps = settings.get('BUNDLE_SOURCE_MAPS', True)
+        # Hashes are computed once per build, every page shares them
+        self.hashes = {}
+        self.built = set()
+
+    def resolve(self, url, kind):
+        """ Returns (prefix, relative name) of a local theme asset, or None."""
+        if '//' in url and not url.startswith(self.settings.get('SITEURL') or '//'):
+            return None
+        marker = '{}/{}/'.format(self.static_dir, kind)
+        index = url.find(marker)
+        if index < 0 or (index > 0 and url[index - 1] != '/'):
+            return None
+        name = url[index + len(marker):]
+        if '?' in name or '#' in name:
+            return None
+        match = _hashed_re.match(name)
+        if match and not os.path.isfile(os.path.join(self.source_dir, kind, name)):
+            name = match.group(1) + match.group(2)
+        if not os.path.isfile(os.path.join(self.source_dir, kind, name)):
+            return None
+        return url[:index], name
+
+    def file_hash(self, path):
+        if path not in self.hashes:
+            with open(path, 'rb') as f:
+                self.hashes[path] = hashlib.sha1(f.read()).hexdigest()
+        return self.hashes[path]
+
+    def build(self, kind, names):
+        """ Writes the bundle of names if needed and returns its file name."""
+        key = hashlib.sha1(BUNDLE_VERSION.encode('utf-8'))
+        key.update('{}:{}:{}'.format(kind, self.minify, self.source_maps).encode('utf-8'))
+        for name in names:
+            key.update(name.encode('utf-8'))
+            key.update(self.file_hash(os.path.join(self.source_dir, kind, name)).encode('utf-8'))
+        bundle_name = 'bundle.{}.{}'.format(key.hexdigest()[:HASH_LENGTH], kind)
+        if bundle_name in self.built:
+            return bundle_name
+
+        files = [bundle_name]
+        if self.source_maps:
+            files.append(bundle_name + '.map')
+        out_dir = os.path.join(self.output_path, self.static_dir, kind)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        if not all(os.path.isfile(os.path.join(self.cache_dir, f)) for f in files):
+            chunks = []
+            line_counts = []
+            for name in names:
+                with open(os.path.join(self.source_dir, kind, name), encoding='utf-8') as f:
+                    text = _source_map_re.sub('', f.read())
+                minified = minify(kind, name, text) if self.minify else text
+                minified = minified.strip('\n')
+                chunks.append(minified)
+                line_counts.append((minified.count('\n') + 1, text.count('\n') + 1))
+            separator = ';\n' if kind == 'js' else '\n'
+            content = separator.join(chunks)
+            if self.source_maps:
+                comment = '//# sourceMappingURL={}.map' if kind == 'js' else '/*# sourceMappingURL={}.map */'
+                content += '\n' + comment.format(bundle_name) + '\n'
+                with open(os.path.join(self.cache_dir, bundle_name + '.map'), 'w', encoding='utf-8') as f:
+                    json.dump(source_map(bundle_name, names, line_counts), f, separators=(',', ':'))
+            with open(os.path.join(self.cache_dir, bundle_name), 'w', encoding='utf-8') as f:
+                f.write(content)
+            logger.info('asset_bundler: built {} from {}'.format(bundle_name, ', '.join(names)))
+
+        for f in files:
+            out_file = os.path.join(out_dir, f)
+            if not os.path.isfile(out_file):
+                shutil.copy2(os.path.join(self.cache_dir, f), out_file)
+        self.built.add(bundle_name)
+        return bundle_name
+
+    def replace_runs(self, html, tag_re, kind, make_tag, bundles):
+        """ Replaces every run of consecutive local tags by a single bundle tag.
+
+        The names of the bundles used are added to ``bundles``.
+        """
+        runs = []
+        current = []
+        for match in tag_re.finditer(html):
+            url = next(g for g in match.groups() if g)
+            resolved = self.resolve(url, kind)
+            if resolved is None:
+                if current:
+                    runs.append(current)
+                current = []
+                continue
+            if current and (html[current[-1][0].end():match.start()].strip() or
+                            current[-1][1][0] != resolved[0]):
+                runs.append(current)
+                current = []
+            current.append((match, resolved))
+        if current:
+            runs.append(current)
+
+        for run in reversed(runs):
+            # A single file is loaded as it is
+            if len(run) < 2:
+                continue
+            prefix = run[0][1][0]
+            bundle_name = self.build(kind, [resolved[1] for match, resolved in run])
+            url = '{}{}/{}/{}'.format(prefix, self.static_dir, kind, bundle_name)
+            html = html[:run[0][0].start()] + make_tag(url) + html[run[-1][0].end():]
+            bundles.add(bundle_name)
+        return html
+
+    def rewrite(self, path, context, html):
+        if not self.settings:
+            return html
+        bundles = self.used[path] = set()
+        html = self.replace_runs(html, _script_re, 'js', '<script src="{}"></script>'.format, bundles)
+        return self.replace_runs(html, _link_re, 'css', '<link href="{}" rel="stylesheet"/>'.format, bundles)
+
+    def remove_stale(self, pelican):
+        """ Removes the bundles (and their maps) that no page loads anymore."""
+        if not self.settings or not self.used:
+            return
+        current = set().union(*self.used.values())
+        removed = 0
+        for kind in ('js', 'css'):
+            out_dir = os.path.join(self.output_path, self.static_dir, kind)
+            if not os.path.isdir(out_dir):
+                continue
+            for name in os.listdir(out_dir):
+                match = _bundle_re.match(name)
+                if match and match.group(1) not in current:
+                    os.remove(os.path.join(out_dir, name))
+                    removed += 1
+        if removed:
+            logger.info('asset_bundler: removed {} stale bundle files'.format(removed))
+
+
+bundler = Bundler()
+
+
+def register():
+    signals.all_generators_finalized.connect(bundler.initialize)
+    pipeline.add_step(bundler.rewrite)
+    signals.finalized.connect(bundler.remove_stale)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+r"""
+Asset Fingerprint
+-----------------
+
+Copies every file of the theme static folder next to itself with a content
+hash in its name (``js/jquery.min.js`` -> ``js/jquery.min.1f2e3d4c.js``) and
+rewrites the references in the generated HTML to point at the hashed copy.
+Since a hashed file never changes, the web server can send it with
+``Cache-Control: public, max-age=31536000, immutable`` and browsers skip the
+revalidation request on repeat visits.
+
+A manifest is written to ``output/theme/asset-manifest.json`` with the mapping
+and the header to use. With nginx, a single rule covers all the files::
+
+    location ~* "\.[0-9a-f]{8}\.[a-z0-9]+$" {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+Settings:
+
+* ``FINGERPRINT_EXCLUDE``: list of suffixes that keep their name, defaults to
+  ``['.map']`` since source maps are referenced from inside the scripts.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+
+from pelican import signals
+from pelican.plugins._utils import load_legacy_plugin
+
+pipeline = load_legacy_plugin('html_pipeline', [os.path.dirname(os.path.realpath(__file__))])
+
+logger = logging.getLogger(__name__)
+
+HASH_LENGTH = 8
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_NAME = 'asset-manifest.json'
+
+_hashed_re = re.compile(r'^(.+)\.[0-9a-f]{%d}(\.[^.]+)$' % HASH_LENGTH)
+
+
+class Fingerprinter(object):
+
+    def __init__(self):
+        self.assets = {}
+        self.reference_re = None
+        self.output_path = None
+        self.static_dir = None
+
+    def collect(self, generators):
+        """ Hashes the theme static files, runs once per build before writing."""
+        settings = generators[0].settings
+        exclude = tuple(settings.get('FINGERPRINT_EXCLUDE', ['.map']))
+        self.output_path = generators[0].output_path
+        self.static_dir = settings.get('THEME_STATIC_DIR', 'theme')
+        self.assets = {}
+        source_dir = os.path.join(settings['THEME'], 'static')
+        for root, dirs, files in os.walk(source_dir):
+            for name in files:
+                if name.endswith(exclude) or _hashed_re.match(name):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()[:HASH_LENGTH]
+                base, ext = os.path.splitext(name)
+                rel_dir = os.path.relpath(root, source_dir).replace(os.sep, '/')
+                rel_dir = '' if rel_dir == '.' else rel_dir + '/'
+                original = '{}/{}{}'.format(self.static_dir, rel_dir, name)
+                hashed = '{}/{}{}.{}{}'.format(self.static_dir, rel_dir, base, digest, ext)
+                self.assets[original] = (path, hashed)
+
+        if self.assets:
+            # Longest first, so that a name is never matched by a shorter prefix of it
+            names = sorted(self.assets, key=len, reverse=True)
+            self.reference_re = re.compile(
+                r'(?<=/)(' + '|'.join(re.escape(n) for n in names) + r')(?=["\'?#)\s])')
+        else:
+            self.reference_re = None
+
+    def rewrite(self, path, context, html):
+        """ Points the references of a written page to the hashed assets."""
+        if self.reference_re is None:
+            return html
+        return self.reference_re.sub(lambda m: self.assets[m.group(1)][1], html)
+
+    def write_assets(self, pelican):
+        """ Copies the hashed files, removes stale ones and writes the manifest."""
+        if self.output_path is None:
+            return
+        current = set()
+        for original, (source, hashed) in self.assets.items():
+            current.add(hashed)
+            out_file = os.path.join(self.output_path, hashed)
+            if os.path.isfile(out_file):
+                continue
+            out_dir = os.path.dirname(out_file)
+            if not os.path.isdir(out_dir):
+                os.makedirs(out_dir)
+            shutil.copy2(source, out_file)
+
+        out_static = os.path.join(self.output_path, self.static_dir)
+        manifest_path = os.path.join(out_static, MANIFEST_NAME)
+        # The copies listed by the last build, whose original may have been deleted since
+        produced = set()
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, encoding='utf-8') as f:
+                    produced.update(json.load(f).get('assets', {}).values())
+            except (ValueError, AttributeError):
+                logger.warning('asset_fingerprint: ignoring the unreadable {}'.format(manifest_path))
+        for root, dirs, files in os.walk(out_static):
+            for name in files:
+                match = _hashed_re.match(name)
+                if not match:
+                    continue
+                rel_path = os.path.relpath(os.path.join(root, name), self.output_path).replace(os.sep, '/')
+                original_name = match.group(1) + match.group(2)
+                original = os.path.join(os.path.dirname(rel_path), original_name).replace(os.sep, '/')
+                # Only remove the hashed copies that this plugin produced
+                if (original in self.assets or rel_path in produced) and rel_path not in current:
+                    os.remove(os.path.join(root, name))
+
+        manifest = {
+            'cache_control': CACHE_CONTROL,
+            'assets': {original: hashed for original, (source, hashed) in sorted(self.assets.items())},
+        }
+        if not os.path.isdir(out_static):
+            os.makedirs(out_static)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        logger.info('Fingerprinted {} theme assets'.format(len(self.assets)))
+
+
+fingerprinter = Fingerprinter()
+
+
+def register():
+    signals.all_generators_finalized.connect(fingerprinter.collect)
+    pipeline.add_step(fingerprinter.rewrite)
+    signals.finalized.connect(fingerprinter.write_assets)
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Build Metrics
+-------------
+
+Counters, timers and histograms for the plugins, in place of logging every
+item they process. The other plugins load this module with the loader of
+Pelican, so they get the module Pelican registers whatever its position in
+``PLUGINS``. Without ``build_metrics`` in ``PLUGINS`` the metrics stay
+disabled::
+
+    from pelican.plugins._utils import load_legacy_plugin
+
+    metrics = load_legacy_plugin('build_metrics', [PLUGINS_DIR])
+
+    thumbnails = metrics.counter('header_image_thumbnails_total', 'Thumbnails rendered')
+    render_time = metrics.timer('header_image_render_seconds', 'Time to render a thumbnail')
+
+    thumbnails.inc()
+    with render_time.time():
+        ...
+    timing = render_time.start()
+    ...
+    timing.stop()
+
+Metrics are created once, when the plugin module is loaded. Unless
+``METRICS`` is enabled, ``inc`` and ``observe`` return at once and ``time``
+returns a shared context manager that does nothing, so the calls can stay in
+the hot paths.
+
+At the end of the build, the values are logged as a table and, with
+``METRICS_PROMETHEUS``, written in the text format of Prometheus, for the
+textfile collector of the node exporter for instance. Values are then reset
+for the next build of the development server. Metrics are only reported for
+the process running the build, so they must be updated there: code run by the
+workers of ``parallel_reader``, such as the directives of ``new_pigment``, is
+not instrumented. ``parallel_reader`` counts the documents it gets from its
+workers and from its cache instead.
+
+Settings:
+
+* ``METRICS``: collect the metrics, defaults to False
+* ``METRICS_PROMETHEUS``: path of the Prometheus text file, defaults to None
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import time
+
+from pelican import signals
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the buckets of the timers, in seconds
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+enabled = False
+_metrics = {}
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def stop(self):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.reset()
+
+    def reset(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        if enabled:
+            self.value += amount
+
+    def summary(self):
+        return '{:g}'.format(self.value)
+
+    def prometheus(self):
+        return ['{} {:g}'.format(self.name, self.value)]
+
+
+class Histogram(object):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def observe(self, value):
+        if not enabled:
+            return
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def summary(self):
+        if not self.count:
+            return '0'
+        return '{} observations, sum {:.4g}, mean {:.4g}, max {:.4g}'.format(
+            self.count, self.sum, self.sum / self.count, self.max)
+
+    def prometheus(self):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{le="{:g}"}} {}'.format(self.name, bound, cumulative))
+        lines.append('{}_bucket{{le="+Inf"}} {}'.format(self.name, self.count))
+        lines.append('{}_sum {:g}'.format(self.name, self.sum))
+        lines.append('{}_count {}'.format(self.name, self.count))
+        return lines
+
+
+class _Timing(object):
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def stop(self):
+        self.timer.observe(time.perf_counter() - self.start)
+
+
+class Timer(Histogram):
+    """ Histogram of durations in seconds."""
+
+    def __init__(self, name, help, buckets=TIME_BUCKETS):
+        super(Timer, self).__init__(name, help, buckets)
+
+    def time(self):
+        """ Returns a context manager observing the time spent in it."""
+        return _Timing(self) if enabled else _null_timer
+
+    def start(self):
+        """ Returns a started timing, observed when its stop method is called."""
+        return self.time().__enter__()
+
+    def summary(self):
+        if not self.count:
+            return '0'
+        return '{} calls, {:.3f} s in total, mean {:.2f} ms, max {:.2f} ms'.format(
+            self.count, self.sum, 1000 * self.sum / self.count, 1000 * self.max)
+
+
+def _register(metric):
+    if metric.name in _metrics:
+        existing = _metrics[metric.name]
+        if type(existing) is not type(metric):
+            raise ValueError('metric {} already registered as a {}'.format(metric.name, existing.kind))
+        return existing
+    _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name, help=''):
+    return _register(Counter(name, help))
+
+
+def histogram(name, help='', buckets=TIME_BUCKETS):
+    return _register(Histogram(name, help, buckets))
+
+
+def timer(name, help=''):
+    return _register(Timer(name, help))
+
+
+def prometheus_text():
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        if metric.help:
+            lines.append('# HELP {} {}'.format(name, metric.help))
+        lines.append('# TYPE {} {}'.format(name, metric.kind))
+        lines.extend(metric.prometheus())
+    return '\n'.join(lines) + '\n'
+
+
+def start(pelican):
+    global enabled
+    enabled = pelican.settings.get('METRICS', False)
+    for metric in _metrics.values():
+        metric.reset()
+
+
+def report(pelican):
+    if not enabled:
+        return
+    width = max([len(name) for name in _metrics] + [0])
+    lines = ['{:<{}} {}'.format(name, width, metric.summary()) for name, metric in sorted(_metrics.items())]
+    logger.info('build_metrics: values of this build\n' + '\n'.join(lines))
+
+    path = pelican.settings.get('METRICS_PROMETHEUS')
+    if path:
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        # The collector may read the file at any time, it is replaced in one step
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        os.replace(path + '.tmp', path)
+    for metric in _metrics.values():
+        metric.reset()
+
+
+def register():
+    signals.initialized.connect(start)
+    signals.finalized.connect(report)
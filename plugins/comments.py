@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Comments
+--------
+
+Pre-renders the comments of every article into a static fragment, so
+``comments_load.js`` never has to rely on a 404 to know that an article has
+no comments.
+
+Comments are read from a local store, ``COMMENTS_PATH``, which can be:
+
+* a folder of ``.json`` files, as committed by Staticman. Each file holds one
+  comment (or a list of them) with the fields ``url``, ``name``, ``website``,
+  ``message`` and ``date`` (a unix timestamp or an ISO date),
+* a SQLite database (``.db``, ``.sqlite`` or ``.sqlite3``) with a ``comments``
+  table that has the same columns.
+
+Each article gets ``comments/<article url>/comments.html``. Articles without
+comments get a short empty-state fragment instead. The fragments are rendered
+with the theme template ``comment_list.html``, and only for the articles whose
+comments changed since the last build (tracked in
+``CACHE_PATH/comments.json``). The source of the template, and of the
+templates it includes, is part of what is tracked: changing it renders all
+the fragments again. The fragments of articles that are gone are removed.
+
+Every article gets a ``comments_src`` attribute with the location of its
+fragment, which ``comments.html`` hands to the loader.
+
+Settings:
+
+* ``COMMENTS_PATH``: location of the store, relative to the repository. The
+  plugin does nothing if it is not set.
+* ``COMMENTS_SAVE_AS``: defaults to ``comments/{url}/comments.html``
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+
+from datetime import datetime
+from pelican import signals
+from pelican.generators import Generator
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+FIELDS = ('url', 'name', 'website', 'message', 'date')
+EMPTY_FRAGMENT = '<h3 class="mb-3">No comments yet, be the first!</h3>\n'
+
+
+def normalize_url(url):
+    return (url or '').strip('/')
+
+
+def parse_date(value):
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        value = float(value)
+        # Staticman uses milliseconds
+        return datetime.fromtimestamp(value / 1000 if value > 1e11 else value)
+    try:
+        return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def read_json_store(path):
+    for root, dirs, files in os.walk(path):
+        for name in sorted(files):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(root, name), encoding='utf-8') as f:
+                data = json.load(f)
+            for comment in data if isinstance(data, list) else [data]:
+                yield comment
+
+
+def read_sqlite_store(path):
+    import sqlite3
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    try:
+        for row in connection.execute('SELECT {} FROM comments'.format(', '.join(FIELDS))):
+            yield dict(row)
+    finally:
+        connection.close()
+
+
+def load_comments(path):
+    """ Returns {normalized url: [comment, ...]} with the comments sorted by date."""
+    if path.endswith(SQLITE_SUFFIXES):
+        records = read_sqlite_store(path) if os.path.isfile(path) else []
+    else:
+        records = read_json_store(path) if os.path.isdir(path) else []
+
+    comments = {}
+    for record in records:
+        comment = {field: record.get(field) for field in FIELDS}
+        comment['date'] = parse_date(comment['date'])
+        # Only plain links, anything else (e.g. javascript:) is dropped
+        if not (comment['website'] or '').startswith(('http://', 'https://')):
+            comment['website'] = ''
+        comments.setdefault(normalize_url(comment['url']), []).append(comment)
+    for url in comments:
+        comments[url].sort(key=lambda c: c['date'] or datetime.min)
+    return comments
+
+
+def template_hash(env, name):
+    """ Hashes the source of a template and of the templates it extends, includes or imports."""
+    from jinja2 import meta
+
+    digest = hashlib.sha1(EMPTY_FRAGMENT.encode('utf-8'))
+    names, seen = [name], set()
+    while names:
+        name = names.pop()
+        if name is None or name in seen:
+            continue
+        seen.add(name)
+        source = env.loader.get_source(env, name)[0]
+        digest.update(source.encode('utf-8'))
+        names.extend(meta.find_referenced_templates(env.parse(source)))
+    return digest.hexdigest()
+
+
+def comments_hash(comments, template_digest=''):
+    data = json.dumps(comments, sort_keys=True, default=str)
+    return hashlib.sha1((template_digest + data).encode('utf-8')).hexdigest()
+
+
+class CommentsGenerator(Generator):
+
+    def __init__(self, *args, **kwargs):
+        super(CommentsGenerator, self).__init__(*args, **kwargs)
+        self.store = self.settings.get('COMMENTS_PATH')
+        self.save_as = self.settings.get('COMMENTS_SAVE_AS', 'comments/{url}/comments.html')
+        self.manifest_path = os.path.join(self.settings.get('CACHE_PATH', 'cache'), 'comments.json')
+
+    def articles(self):
+        return self.context['articles'] + [t for a in self.context['articles'] for t in a.translations]
+
+    def generate_context(self):
+        if not self.store:
+            return
+        for article in self.articles():
+            article.comments_src = self.save_as.format(url=normalize_url(article.url))
+
+    def generate_output(self, writer):
+        if not self.store:
+            return
+        comments = load_comments(self.store)
+
+        manifest = {}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+
+        template = self.get_template('comment_list')
+        template_digest = template_hash(self.env, template.name)
+        rendered = 0
+        articles = self.articles()
+        new_manifest = {}
+        for article in articles:
+            article_comments = comments.get(normalize_url(article.url), [])
+            save_as = article.comments_src
+            path = os.path.join(self.output_path, save_as)
+            digest = comments_hash(article_comments, template_digest)
+            new_manifest[save_as] = digest
+            if manifest.get(save_as) == digest and os.path.isfile(path):
+                continue
+
+            if article_comments:
+                html = template.render(dict(self.context, article=article, comments=article_comments))
+            else:
+                html = EMPTY_FRAGMENT
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            rendered += 1
+
+        # Articles that were deleted, or whose URL changed
+        removed = 0
+        for save_as in set(manifest) - set(new_manifest):
+            path = os.path.join(self.output_path, save_as)
+            if os.path.isfile(path):
+                os.remove(path)
+                removed += 1
+            try:
+                os.removedirs(os.path.dirname(path))
+            except OSError:
+                # Not empty
+                pass
+
+        if not os.path.isdir(os.path.dirname(self.manifest_path)):
+            os.makedirs(os.path.dirname(self.manifest_path))
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(new_manifest, f, indent=1, sort_keys=True)
+        logger.info('comments: {} comments, {} of {} fragments regenerated, {} removed'.format(
+            sum(len(c) for c in comments.values()), rendered, len(articles), removed))
+
+
+def get_generators(generators):
+    return CommentsGenerator
+
+
+def register():
+    signals.get_generators.connect(get_generators)
@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+"""
+Critical CSS
+------------
+
+Inlines the CSS rules needed to paint the top of the page in ``<head>`` and
+loads the stylesheets asynchronously, so the first paint no longer waits for
+the whole of Bootstrap.
+
+For each page type (``article``, ``index``, ``static_index``, ``page``) the
+first page written is taken as the model: the elements at the top of its body
+(the first ``CRITICAL_CSS_FOLD_ELEMENTS`` of them, which covers the navigation
+bar and the header) are matched against every rule of the stylesheets the page
+links to. The matching rules, with the ``@media`` blocks and ``@font-face``
+declarations they need, become the critical CSS of that page type. Every page
+of the type gets it in a ``<style>`` tag, and its stylesheet links are turned
+into ``<link rel="preload" as="style">`` tags that apply themselves once
+loaded, with a ``<noscript>`` fallback.
+
+Matching selectors is slow in pure Python, so the result is stored in
+``CACHE_PATH/critical_css`` under the hash of the theme templates and of the
+stylesheets. As long as neither changes, builds only read it back.
+
+Must be listed after ``asset_bundler`` (so that it sees the bundles) and before
+``asset_fingerprint`` in ``PLUGINS``.
+
+Settings:
+
+* ``CRITICAL_CSS_TEMPLATES``: page types to process, defaults to
+  ``['article', 'index', 'static_index', 'page']``
+* ``CRITICAL_CSS_FOLD_ELEMENTS``: number of body elements considered above the
+  fold, defaults to 150
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import os
+import re
+
+from pelican import signals
+from pelican.plugins._utils import load_legacy_plugin
+
+pipeline = load_legacy_plugin('html_pipeline', [os.path.dirname(os.path.realpath(__file__))])
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate the cached critical CSS when the extraction changes
+CRITICAL_VERSION = '1'
+HASH_LENGTH = 8
+# Stands for the path to the site root in the cached CSS, replaced when inlined
+ROOT_MARKER = '__critical_css_root__/'
+
+_link_re = re.compile(r'<link\s+(?:href="([^"]+)"\s+rel="stylesheet"|rel="stylesheet"\s+href="([^"]+)")\s*/?>')
+_hashed_re = re.compile(r'^(.+)\.[0-9a-f]{%d}(\.[^.]+)$' % HASH_LENGTH)
+_comment_re = re.compile(r'/\*.*?\*/', re.DOTALL)
+_url_re = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+_font_family_re = re.compile(r'font-family\s*:\s*([^;}]+)')
+# States that do not apply on first paint, and pseudo-elements, are ignored when matching
+_pseudo_re = re.compile(r'::?(?:hover|focus|focus-within|focus-visible|active|visited|target|before|after|'
+                        r'first-letter|first-line|selection|placeholder|marker|backdrop|-[\w-]+)(?:\([^)]*\))?')
+_tag_name_re = re.compile(r'^[a-zA-Z][\w-]*')
+_id_re = re.compile(r'#([\w-]+)')
+_class_re = re.compile(r'\.([\w-]+)')
+
+
+def parse_css(text):
+    """ Returns the top level statements of a stylesheet as (prelude, block) pairs.
+
+    Statements without a block, like ``@import``, have None as block.
+    """
+    statements = []
+    position = 0
+    length = len(text)
+    while position < length:
+        start = position
+        quote = None
+        while position < length:
+            char = text[position]
+            if quote:
+                if char == '\\':
+                    position += 1
+                elif char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char in '{;':
+                break
+            position += 1
+        prelude = text[start:position].strip()
+        if position >= length:
+            break
+        if text[position] == ';':
+            statements.append((prelude, None))
+            position += 1
+            continue
+        depth = 0
+        block_start = position + 1
+        while position < length:
+            char = text[position]
+            if quote:
+                if char == '\\':
+                    position += 1
+                elif char == quote:
+                    quote = None
+            elif char in '"\'':
+                quote = char
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if not depth:
+                    break
+            position += 1
+        statements.append((prelude, text[block_start:position].strip()))
+        position += 1
+    return statements
+
+
+def split_selectors(prelude):
+    """ Splits a selector list on the commas that are not inside parentheses."""
+    selectors = []
+    depth = 0
+    start = 0
+    for index, char in enumerate(prelude):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char == ',' and not depth:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+    selectors.append(prelude[start:].strip())
+    return [s for s in selectors if s]
+
+
+def key_compound(selector):
+    """ Returns the last compound selector, the one that names the element styled."""
+    depth = 0
+    start = 0
+    for index, char in enumerate(selector):
+        if char in '([':
+            depth += 1
+        elif char in ')]':
+            depth -= 1
+        elif char in ' >+~' and not depth:
+            start = index + 1
+    return re.sub(r'\[[^\]]*\]|\([^)]*\)', '', selector[start:])
+
+
+class FoldMatcher(object):
+    """ Tells whether a selector matches any element above the fold of a page."""
+
+    def __init__(self, html, fold_elements):
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, 'html.parser')
+        body = soup.body or soup
+        self.elements = [element for element in (soup.html, soup.body) if element is not None]
+        self.elements += body.find_all(True, limit=fold_elements)
+        self.by_id = {}
+        self.by_class = {}
+        self.by_tag = {}
+        for element in self.elements:
+            if element.get('id'):
+                self.by_id.setdefault(element['id'], []).append(element)
+            for name in element.get('class') or []:
+                self.by_class.setdefault(name, []).append(element)
+            self.by_tag.setdefault(element.name, []).append(element)
+
+    def candidates(self, compound):
+        """ Elements that could match a compound selector, from the indexes."""
+        if '\\' in compound:
+            return self.elements
+        ids = _id_re.findall(compound)
+        if ids:
+            return self.by_id.get(ids[0], [])
+        classes = _class_re.findall(compound)
+        if classes:
+            return self.by_class.get(classes[0], [])
+        tag = _tag_name_re.match(compound)
+        if tag:
+            return self.by_tag.get(tag.group(0).lower(), [])
+        return self.elements
+
+    def matches(self, selector):
+        import soupsieve
+
+        selector = _pseudo_re.sub('', selector).strip() or '*'
+        if selector.endswith(('>', '+', '~')):
+            selector += ' *'
+        candidates = self.candidates(key_compound(selector))
+        if not candidates:
+            return False
+        try:
+            compiled = soupsieve.compile(selector)
+        except Exception:
+            # Unknown to soupsieve, better to keep the rule than to break the page
+            return True
+        return any(compiled.match(element) for element in candidates)
+
+
+def absolute_urls(css, css_dir):
+    """ Makes the relative url() of a stylesheet relative to the site root."""
+    def replace(match):
+        url = match.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        return 'url({}{}{})'.format(ROOT_MARKER, css_dir, url)
+    return _url_re.sub(replace, css)
+
+
+def critical_rules(statements, matcher):
+    """ Returns the rules of statements used above the fold, as a list of strings."""
+    rules = []
+    for prelude, block in statements:
+        if block is None:
+            continue
+        if prelude.startswith(('@media', '@supports')):
+            if prelude.startswith('@media') and 'print' in prelude and 'screen' not in prelude:
+                continue
+            inner = critical_rules(parse_css(block), matcher)
+            if inner:
+                rules.append('{}{{{}}}'.format(prelude, ''.join(inner)))
+        elif prelude.startswith('@'):
+            # @font-face is added afterwards if needed, @keyframes, @page, ... can wait
+            continue
+        else:
+            selectors = [s for s in split_selectors(prelude) if matcher.matches(s)]
+            if selectors:
+                rules.append('{}{{{}}}'.format(','.join(selectors), block))
+    return rules
+
+
+def font_faces(statements, rules):
+    """ Returns the @font-face rules of the fonts used by rules."""
+    used = set()
+    for families in _font_family_re.findall(''.join(rules)):
+        used.update(f.strip().strip('\'"').lower() for f in families.split(','))
+    faces = []
+    for prelude, block in statements:
+        if prelude == '@font-face' and block:
+            family = _font_family_re.search(block)
+            if family and family.group(1).strip().strip('\'"').lower() in used:
+                faces.append('@font-face{{{}}}'.format(block))
+    return faces
+
+
+def extract(html, stylesheets, fold_elements):
+    """ Returns the critical CSS of a page, for the stylesheets [(path, css dir)]."""
+    matcher = FoldMatcher(html, fold_elements)
+    statements = []
+    for path, css_dir in stylesheets:
+        with open(path, encoding='utf-8') as f:
+            css = _comment_re.sub('', f.read())
+        statements += parse_css(absolute_urls(css, css_dir))
+    rules = critical_rules(statements, matcher)
+    css = ''.join(font_faces(statements, rules) + rules)
+    try:
+        from rcssmin import cssmin
+        return cssmin(css)
+    except ImportError:
+        return css
+
+
+def page_type(path, context, template_pages):
+    """ Returns the page type of a written page: a template name, or None."""
+    if path in template_pages:
+        return template_pages[path]
+    for key in ('article', 'page'):
+        if key in context:
+            return key
+    if 'articles_page' in context and not any(k in context for k in ('tag', 'category', 'author')):
+        return 'index'
+    return None
+
+
+class CriticalCss(object):
+
+    def __init__(self):
+        self.settings = {}
+        self.critical = {}
+        self.hashes = {}
+
+    def initialize(self, generators):
+        settings = generators[0].settings
+        self.settings = settings
+        self.output_path = generators[0].output_path
+        self.static_dir = settings.get('THEME_STATIC_DIR', 'theme')
+        self.source_dir = os.path.join(settings['THEME'], 'static')
+        self.cache_dir = os.path.join(settings.get('CACHE_PATH', 'cache'), 'critical_css')
+        self.templates = set(settings.get('CRITICAL_CSS_TEMPLATES', ['article', 'index', 'static_index', 'page']))
+        self.fold_elements = settings.get('CRITICAL_CSS_FOLD_ELEMENTS', 150)
+        self.template_pages = {
+            os.path.normpath(os.path.join(self.output_path, save_as)): os.path.splitext(os.path.basename(source))[0]
+            for source, save_as in settings.get('TEMPLATE_PAGES', {}).items()}
+        self.templates_hash = self.folder_hash(os.path.join(settings['THEME'], 'templates'))
+        # Computed once per build, every page of a type shares them
+        self.critical = {}
+        self.hashes = {}
+
+    def folder_hash(self, folder):
+        digest = hashlib.sha1()
+        for root, dirs, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, folder).encode('utf-8'))
+                digest.update(self.file_hash(path).encode('utf-8'))
+        return digest.hexdigest()
+
+    def file_hash(self, path):
+        if path not in self.hashes:
+            with open(path, 'rb') as f:
+                self.hashes[path] = hashlib.sha1(f.read()).hexdigest()
+        return self.hashes[path]
+
+    def resolve(self, url):
+        """ Returns (prefix, path, css dir) of a local stylesheet, or None."""
+        if '//' in url and not url.startswith(self.settings.get('SITEURL') or '//'):
+            return None
+        marker = '{}/css/'.format(self.static_dir)
+        index = url.find(marker)
+        if index < 0 or (index > 0 and url[index - 1] != '/'):
+            return None
+        name = url[index + len(marker):]
+        if '?' in name or '#' in name:
+            return None
+        css_dir = marker + os.path.dirname(name) + '/' if os.path.dirname(name) else marker
+        # Bundles only exist in the output, the other files in the theme
+        for folder in (os.path.join(self.output_path, self.static_dir, 'css'), os.path.join(self.source_dir, 'css')):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                return url[:index], path, css_dir
+            match = _hashed_re.match(name)
+            if match and os.path.isfile(os.path.join(folder, match.group(1) + match.group(2))):
+                return url[:index], os.path.join(folder, match.group(1) + match.group(2)), css_dir
+        return None
+
+    def critical_css(self, kind, html, stylesheets):
+        """ Returns the critical CSS of a page type, from the cache when possible."""
+        key = hashlib.sha1(CRITICAL_VERSION.encode('utf-8'))
+        key.update('{}:{}:{}'.format(kind, self.fold_elements, self.templates_hash).encode('utf-8'))
+        for path, css_dir in stylesheets:
+            key.update(css_dir.encode('utf-8'))
+            key.update(self.file_hash(path).encode('utf-8'))
+        key = key.hexdigest()[:HASH_LENGTH]
+        if (kind, key) in self.critical:
+            return self.critical[kind, key]
+
+        cache_name = '{}.{}.css'.format(kind, key)
+        cache_path = os.path.join(self.cache_dir, cache_name)
+        if os.path.isfile(cache_path):
+            with open(cache_path, encoding='utf-8') as f:
+                css = f.read()
+        else:
+            css = extract(html, stylesheets, self.fold_elements)
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(kind + '.') and name != cache_name:
+                    os.remove(os.path.join(self.cache_dir, name))
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(css)
+            total = sum(os.path.getsize(path) for path, css_dir in stylesheets)
+            logger.info('critical_css: {} pages inline {} of {} bytes of CSS'.format(kind, len(css), total))
+        self.critical[kind, key] = css
+        return css
+
+    def inline(self, path, context, html):
+        if not self.settings:
+            return html
+        kind = page_type(os.path.normpath(path), context, self.template_pages)
+        if kind not in self.templates:
+            return html
+
+        links = []
+        for match in _link_re.finditer(html):
+            resolved = self.resolve(next(g for g in match.groups() if g))
+            if resolved is not None:
+                links.append((match, resolved))
+        if not links:
+            return html
+        css = self.critical_css(kind, html, [(path, css_dir) for m, (prefix, path, css_dir) in links])
+        if not css:
+            return html
+
+        style = '<style>{}</style>'.format(css.replace(ROOT_MARKER, links[0][1][0]))
+        for index, (match, resolved) in reversed(list(enumerate(links))):
+            url = next(g for g in match.groups() if g)
+            tag = ('<link rel="preload" href="{0}" as="style" onload="this.onload=null;this.rel=\'stylesheet\'"/>'
+                   '<noscript><link href="{0}" rel="stylesheet"/></noscript>').format(url)
+            if not index:
+                tag = style + tag
+            html = html[:match.start()] + tag + html[match.end():]
+        return html
+
+
+critical = CriticalCss()
+
+
+def register():
+    signals.all_generators_finalized.connect(critical.initialize)
+    pipeline.add_step(critical.inline)
@@ -3,16 +3,18 @@ from __future__ import unicode_literals
 
 import itertools
 
+import base64
+import io
+import json
 import logging
 import os
 import textwrap
-from PIL import Image, ImageFont, ImageDraw, ImageEnhance
 from pelican import signals
 from pelican.generators import ArticlesGenerator, PagesGenerator
+from pelican.plugins._utils import load_legacy_plugin
 from shutil import copyfile
 
-from lxml import html
-from lxml.html.clean import clean_html
+metrics = load_legacy_plugin('build_metrics', [os.path.dirname(os.path.dirname(os.path.realpath(__file__)))])
 
 # Size that will be used as a base for generating the thumbnails
 # It should be at least as large as the largest of the thumbnail sizes.
@@ -29,8 +31,22 @@ th_sizes = {
     'header': [825, 1200]
 }
 
+# Width of the blurred placeholders shown while the thumbnails load
+placeholder_width = 16
+
+# Sizes shown with a placeholder by the theme (macros/article_thumbnail.html), the
+# others are only used by the sharing platforms
+placeholder_sizes = ('thumbnail',)
+
 logger = logging.getLogger(__name__)
 
+# [mtime, file size, placeholder, width, height] of every generated image with a placeholder
+render_cache = {}
+
+thumbnails_rendered = metrics.counter('header_image_thumbnails_rendered_total', 'Thumbnails rendered')
+thumbnails_kept = metrics.counter('header_image_thumbnails_kept_total', 'Thumbnails already in the output')
+render_time = metrics.timer('header_image_render_seconds', 'Time to render a thumbnail')
+
 # Load the fonts
 cur_dir = os.path.dirname(os.path.realpath(__file__))
 font_path_title = os.path.join(cur_dir, 'AmaticSC-Bold.ttf')
@@ -48,7 +64,43 @@ def illustration_clipper(x):
     return x[15:] if x[15] == '/' else x[14:]
 
 
+def make_placeholder(im):
+    """ Returns a tiny version of the image as a data URI, the browser blurs it when scaling it up."""
+    from PIL import Image
+
+    width, height = im.size
+    small = im.convert('RGB').resize((placeholder_width, max(1, round(placeholder_width * height / width))),
+                                     Image.BILINEAR)
+    buffer = io.BytesIO()
+    # Smaller than a JPEG at this size, whose headers alone take ~600 bytes
+    small.save(buffer, 'PNG', optimize=True)
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def cached_placeholder(path, im=None):
+    """ Returns (placeholder, width, height) of a generated image.
+
+    They are computed from ``im``, the image just saved, or taken from the cache.
+    """
+    stat = os.stat(path)
+    stamp = [stat.st_mtime_ns, stat.st_size]
+    if im is None:
+        cached = render_cache.get(path)
+        if cached is not None and len(cached) == 5 and cached[:2] == stamp:
+            return cached[2:]
+        # Generated before the cache existed, or by another tool
+        from PIL import Image
+        im = Image.open(path)
+    render_cache[path] = stamp + [make_placeholder(im)] + list(im.size)
+    return render_cache[path][2:]
+
+
 def process_image(generator, content, image):
+    # PIL and lxml are only imported when there is an image to process
+    from PIL import Image, ImageFont, ImageDraw, ImageEnhance
+    from lxml import html
+    from lxml.html.clean import clean_html
+
     illustration = False
     if image.startswith('{attach}'):
         image = attach_clipper(image)
@@ -84,20 +136,21 @@ def process_image(generator, content, image):
         if not os.path.isfile(output_image_path) or generator.settings.get('FORCE_IMG_REBUILD', False):
             copyfile(path, output_image_path)
             im = Image.open(output_image_path)
-            im.thumbnail((base_size[0], base_size[1]), Image.ANTIALIAS)
+            im.thumbnail((base_size[0], base_size[1]), Image.LANCZOS)
             im.save(output_image_path)
 
         for key in th_sizes:
             th_name = ''.join(image.split('.')[:-1]) + '_' + key + '.' + image.split('.')[-1]
             th_full_path = os.path.join(output_path, th_name)
-            logger.info('Save image path: {}'.format(th_full_path))
 
             th_size = th_sizes[key]
+            rendered = None
 
             if not os.path.isfile(th_full_path) or generator.settings.get('FORCE_IMG_REBUILD', False):
+                timing = render_time.start()
                 im = Image.open(output_image_path)
-                if key is 'header':
-                    im.thumbnail((th_size[0], th_size[1]), Image.ANTIALIAS)
+                if key == 'header':
+                    im.thumbnail((th_size[0], th_size[1]), Image.LANCZOS)
                     im_copped = im
                 else:
                     width, height = im.size
@@ -107,7 +160,7 @@ def process_image(generator, content, image):
 
                     if ar_image > ar_th:
                         width_th = width * th_size[1] / height
-                        im.thumbnail((width_th, th_size[1]), Image.ANTIALIAS)
+                        im.thumbnail((width_th, th_size[1]), Image.LANCZOS)
                         # Crop the image to the desired size, assuming the height is correct
                         left = int((width_th - th_size[0]) / 2)
                         right = int((width_th + th_size[0]) / 2)
@@ -115,7 +168,7 @@ def process_image(generator, content, image):
 
                     else:
                         height_th = height * th_size[0]/width
-                        im.thumbnail((th_size[0], height_th), Image.ANTIALIAS)
+                        im.thumbnail((th_size[0], height_th), Image.LANCZOS)
                         # Crop the image to the desired size, assuming the width is correct
                         bottom = int((height_th - th_size[1]) / 2)
                         top = int((height_th + th_size[1]) / 2)
@@ -123,6 +176,7 @@ def process_image(generator, content, image):
 
                 if illustration:
                     im_copped.save(th_full_path)
+                    rendered = im_copped
                 else:
                     # Make it darker, to display the text without problems
                     brightness = ImageEnhance.Brightness(im_copped)
@@ -133,8 +187,6 @@ def process_image(generator, content, image):
                     font_size = int(th_size[1] / 3.5 / 10 * 7.5)  #  The last bit: /10*7.5 is to convert to points from pixels
                     font = ImageFont.truetype(font_path_title, font_size)
                     text = textwrap.fill(title, width=24)
-                    text_size = draw.textsize(text)
-                    logger.info('Text size: {}, image width: {}'.format(text_size, th_size[0]))
                     y_pos = int(th_size[1]*1/10)
                     x_pos = int(th_size[0]/8)
                     draw.text((x_pos, y_pos), text, (255, 255, 255), font=font)
@@ -142,14 +194,22 @@ def process_image(generator, content, image):
                     # Write the website name
                     font = ImageFont.truetype(font_path_website, int(font_size*.8))
                     text = textwrap.fill("Python for the Lab.com", width=24)
-                    text_size = draw.textsize(text)
-                    logger.info('Website text size: {}, image width: {}'.format(text_size, th_size[0]))
                     x_pos = int(th_size[0] / 9)
                     y_pos = int(th_size[1] * 3.8 / 5)
                     draw.text((x_pos, y_pos), text, (255, 255, 255), font=font)
                     im_dark.save(th_full_path)
+                    rendered = im_dark
+                timing.stop()
+                thumbnails_rendered.inc()
+            else:
+                thumbnails_kept.inc()
 
             setattr(content, 'header_'+key, os.path.join(out_dir, th_name))
+            if key in placeholder_sizes:
+                placeholder, width, height = cached_placeholder(th_full_path, rendered)
+                setattr(content, 'header_'+key+'_placeholder', placeholder)
+                setattr(content, 'header_'+key+'_width', width)
+                setattr(content, 'header_'+key+'_height', height)
 
         if illustration:
             th_name = ''.join(image.split('.')[:-1]) + '_' + 'header' + '.' + image.split('.')[-1]
@@ -171,6 +231,12 @@ def detect_header(generator, content):
 
 def detect_image_header(generators):
     """ Runs generator on both pages and articles."""
+    cache_path = os.path.join(generators[0].settings.get('CACHE_PATH', 'cache'), 'header_image.json')
+    render_cache.clear()
+    if os.path.isfile(cache_path):
+        with open(cache_path) as f:
+            render_cache.update(json.load(f))
+
     for generator in generators:
         if isinstance(generator, ArticlesGenerator):
             for article in itertools.chain(generator.articles, generator.translations, generator.drafts):
@@ -179,6 +245,11 @@ def detect_image_header(generators):
             for page in itertools.chain(generator.pages, generator.translations, generator.hidden_pages):
                 detect_header(generator, page)
 
+    if not os.path.isdir(os.path.dirname(cache_path)):
+        os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, 'w') as f:
+        json.dump(render_cache, f)
+
 
 def register():
     try:
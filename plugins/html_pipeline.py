@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+HTML Pipeline
+-------------
+
+A single pass over every page Pelican writes, shared by the plugins that
+rewrite the pages once they are rendered (asset_bundler, critical_css,
+asset_fingerprint, resource_hints and html_minify). Instead of each of them
+reading the page and writing it back, they add a step::
+
+    from pelican.plugins._utils import load_legacy_plugin
+
+    pipeline = load_legacy_plugin('html_pipeline', [PLUGINS_DIR])
+
+    def register():
+        pipeline.add_step(rewrite)
+
+where ``rewrite(path, context, html)`` returns the new HTML of the page. The
+steps run in the order their plugins are listed in ``PLUGINS``.
+
+Pelican's writer is replaced by ``PipelineWriter``, which keeps the rendered
+pages in memory instead of writing them. On ``content_written`` the page goes
+through the steps and is written once, and only if the result differs from
+the file already in the output: pages that did not change keep their mtime,
+and the ETag the server derives from it. The plugins that read the written
+pages on ``content_written`` must connect after the first step is added, which
+is the case of the ones connecting when their generator is created.
+
+This module is not a plugin, it does not need to be listed in ``PLUGINS``:
+the first step added connects the pass.
+"""
+
+from __future__ import unicode_literals
+
+import io
+import logging
+import os
+
+from pelican import signals
+from pelican.writers import FileOverwriteFailedError, Writer
+
+logger = logging.getLogger(__name__)
+
+steps = []
+# {path: rendered page}, until the pass writes it
+_pending = {}
+# Pages written and pages left as they were, in this build
+_counts = [0, 0]
+
+
+class _RenderedPage(io.StringIO):
+    """ File object that hands what is written to it to the pass."""
+
+    def __init__(self, path):
+        super(_RenderedPage, self).__init__()
+        self.path = path
+
+    def close(self):
+        if not self.closed:
+            _pending[self.path] = self.getvalue()
+        super(_RenderedPage, self).close()
+
+
+class PipelineWriter(Writer):
+    """ Writer keeping the rendered pages in memory for the pass."""
+
+    def _open_w(self, filename, encoding, override=False):
+        if not steps or not filename.endswith('.html'):
+            return super(PipelineWriter, self)._open_w(filename, encoding, override)
+        # The checks of Writer._open_w, which would empty the file of the last build
+        if filename in self._overridden_files:
+            if override:
+                raise FileOverwriteFailedError('Failed to overwrite "{}" a second time'.format(filename))
+            logger.info('Skipping "{}", not overwriting'.format(filename))
+            return open(os.devnull, 'w', encoding=encoding)
+        if filename in self._written_files and not override:
+            raise FileOverwriteFailedError('Failed to overwrite "{}" as Pelican has already '
+                                           'written to it previously'.format(filename))
+        if override:
+            self._overridden_files.add(filename)
+        self._written_files.add(filename)
+        return _RenderedPage(filename)
+
+
+def get_writer(pelican):
+    return PipelineWriter
+
+
+def add_step(step):
+    """ Adds step(path, context, html) -> html to the pass over the written pages."""
+    if step not in steps:
+        steps.append(step)
+    # Connecting the same receivers again does nothing
+    signals.get_writer.connect(get_writer)
+    signals.content_written.connect(rewrite_page)
+    signals.finalized.connect(report)
+
+
+def write_if_changed(path, content):
+    """ Writes content to path unless the file already has it. Returns True if written."""
+    data = content.encode('utf-8')
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def rewrite_page(path, context):
+    html = _pending.pop(path, None)
+    if html is None:
+        if not path.endswith('.html') or not steps or not os.path.isfile(path):
+            return
+        # Written by another writer
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+    for step in steps:
+        html = step(path, context, html)
+    _counts[0 if write_if_changed(path, html) else 1] += 1
+
+
+def report(pelican):
+    if sum(_counts):
+        logger.info('html_pipeline: {} pages written, {} unchanged since the last build'.format(*_counts))
+    _counts[:] = [0, 0]
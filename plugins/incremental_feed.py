@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental Feed
+----------------
+
+Writes the RSS feed of the site with a bounded size, in place of the one of
+``FEED_RSS``, which includes every article and is rewritten on every build.
+
+The feed keeps the ``INCREMENTAL_FEED_MAX_ITEMS`` latest articles, each with
+its summary cut to ``INCREMENTAL_FEED_SUMMARY_LENGTH`` words. Links and GUIDs
+are the ones Pelican uses, so readers do not see the items again when
+switching.
+
+The XML of every item is cached in ``CACHE_PATH/incremental_feed.json``,
+keyed by a hash of the source file of the article, of the settings that
+change the item and of the code that renders it: the markup of the items is
+written by this module, so its source is part of the hash, along with the
+versions of the packages it uses. Only new or edited articles are rendered
+again. The feed
+is only written when its content changed: its mtime, and the ETag the server
+derives from it, stay the same and feed readers polling it get a 304.
+
+Set ``FEED_RSS = None`` to stop Pelican from writing its own feed.
+
+Settings:
+
+* ``INCREMENTAL_FEED_SAVE_AS``: defaults to ``feed.rss``
+* ``INCREMENTAL_FEED_MAX_ITEMS``: defaults to 20
+* ``INCREMENTAL_FEED_SUMMARY_LENGTH``: words per summary, defaults to 60
+"""
+
+from __future__ import unicode_literals
+
+import email.utils
+import hashlib
+import json
+import logging
+import os
+
+from xml.sax.saxutils import escape, quoteattr
+
+from feedgenerator import get_tag_uri
+from markupsafe import Markup
+from pelican import signals
+from pelican.generators import Generator
+from pelican.utils import set_date_tzinfo, truncate_html_words
+
+logger = logging.getLogger(__name__)
+
+# Bump to discard the cached items when their format changes
+FEED_VERSION = 1
+# Packages whose code changes the items
+RENDER_PACKAGES = ('pelican', 'feedgenerator', 'docutils', 'Pygments')
+
+CHANNEL_START = ('<?xml version="1.0" encoding="utf-8"?>\n'
+                 '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" '
+                 'xmlns:dc="http://purl.org/dc/elements/1.1/"><channel>'
+                 '<title>{title}</title><link>{link}</link><description>{description}</description>'
+                 '<atom:link href={feed_url} rel="self"/><lastBuildDate>{date}</lastBuildDate>')
+CHANNEL_END = '</channel></rss>\n'
+
+
+def write_if_changed(path, content):
+    """ Writes content to path unless the file already has it. Returns True if written."""
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+def rfc822(date):
+    return email.utils.format_datetime(date)
+
+
+def code_hash():
+    """ Hashes the code rendering the items: this module and the versions of the packages it uses."""
+    from importlib import metadata
+
+    with open(__file__, 'rb') as f:
+        sha = hashlib.sha1(f.read())
+    for package in RENDER_PACKAGES:
+        try:
+            sha.update('{}={}'.format(package, metadata.version(package)).encode('utf-8'))
+        except metadata.PackageNotFoundError:
+            pass
+    return sha.hexdigest()
+
+
+class IncrementalFeedGenerator(Generator):
+
+    def __init__(self, *args, **kwargs):
+        super(IncrementalFeedGenerator, self).__init__(*args, **kwargs)
+        self.save_as = self.settings.get('INCREMENTAL_FEED_SAVE_AS', 'feed.rss')
+        self.max_items = self.settings.get('INCREMENTAL_FEED_MAX_ITEMS', 20)
+        self.summary_length = self.settings.get('INCREMENTAL_FEED_SUMMARY_LENGTH', 60)
+        self.site_url = self.settings.get('FEED_DOMAIN') or self.settings['SITEURL']
+        self.cache_path = os.path.join(self.settings.get('CACHE_PATH', 'cache'), 'incremental_feed.json')
+        self.code_hash = code_hash()
+
+    def localized(self, date):
+        return set_date_tzinfo(date, self.settings.get('TIMEZONE', None))
+
+    def item_key(self, article):
+        sha = hashlib.sha1(json.dumps([
+            FEED_VERSION, self.code_hash, article.url, self.site_url, self.summary_length,
+            self.settings.get('SUMMARY_END_SUFFIX'), self.settings.get('TIMEZONE'),
+            self.settings.get('FEED_APPEND_REF'),
+        ]).encode('utf-8'))
+        with open(article.source_path, 'rb') as f:
+            sha.update(f.read())
+        return sha.hexdigest()
+
+    def render_item(self, article):
+        link = '{}/{}'.format(self.site_url, article.url)
+        summary = truncate_html_words(article.get_summary(self.site_url), self.summary_length,
+                                      self.settings.get('SUMMARY_END_SUFFIX', '…'))
+        if self.settings.get('FEED_APPEND_REF'):
+            link += '?ref=feed'
+        parts = [
+            '<item><title>{}</title>'.format(escape(Markup(article.title).striptags())),
+            '<link>{}</link>'.format(escape(link)),
+            '<description>{}</description>'.format(escape(summary)),
+        ]
+        if getattr(article, 'author', None):
+            parts.append('<dc:creator>{}</dc:creator>'.format(escape(str(article.author))))
+        parts.append('<pubDate>{}</pubDate>'.format(rfc822(self.localized(article.date))))
+        parts.append('<guid isPermaLink="false">{}</guid>'.format(escape(get_tag_uri(link, article.date))))
+        categories = [article.category] if hasattr(article, 'category') else []
+        categories.extend(getattr(article, 'tags', []))
+        parts.extend('<category>{}</category>'.format(escape(str(c))) for c in categories)
+        parts.append('</item>')
+        return ''.join(parts)
+
+    def load_cache(self):
+        if not os.path.isfile(self.cache_path):
+            return {}
+        with open(self.cache_path, encoding='utf-8') as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                return {}
+
+    def save_cache(self, cache):
+        folder = os.path.dirname(self.cache_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+
+    def generate_output(self, writer):
+        articles = self.context['articles'][:self.max_items]
+        cache = self.load_cache()
+        items = {}
+        rendered = 0
+        for article in articles:
+            key = self.item_key(article)
+            if key not in cache:
+                cache[key] = self.render_item(article)
+                rendered += 1
+            items[key] = cache[key]
+        # Only the items of the current feed are kept
+        self.save_cache(items)
+
+        dates = [self.localized(getattr(a, 'modified', None) or a.date) for a in articles]
+        feed = ''.join([
+            CHANNEL_START.format(
+                title=escape(Markup(self.settings['SITENAME']).striptags()),
+                link=escape(self.site_url + '/'),
+                description=escape(self.settings.get('SITESUBTITLE') or ''),
+                feed_url=quoteattr('{}/{}'.format(self.site_url, self.save_as)),
+                date=rfc822(max(dates)) if dates else ''),
+        ] + list(items.values()) + [CHANNEL_END])
+
+        if write_if_changed(os.path.join(self.output_path, self.save_as), feed):
+            logger.info('incremental_feed: wrote {} with {} items, {} rendered'.format(
+                self.save_as, len(items), rendered))
+
+
+def get_generators(generators):
+    return IncrementalFeedGenerator
+
+
+def register():
+    signals.get_generators.connect(get_generators)
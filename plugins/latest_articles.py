@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Latest Articles
+---------------
+
+Renders the list of the latest articles once per build, from
+``context['articles']``, with the theme template ``latest_articles.html``.
+
+The fragment is written to ``latest_articles.html`` and to
+``latest_articles.<hash>.html``, which never changes and can be cached
+forever. With ``LATEST_ARTICLES_JSON`` a
+``latest_articles.json`` (and its hashed copy) is written as well. Files are
+only rewritten when the list of latest articles changes, so their mtime and
+ETag stay the same between builds.
+
+Templates get:
+
+* ``LATEST_ARTICLES_HTML``: the rendered fragment, to inline it and skip the
+  request altogether,
+* ``LATEST_ARTICLES_URL``: the URL of the hashed fragment.
+
+``static_index.html`` inlines the fragment. With ``LATEST_ARTICLES_INLINE``
+disabled it gives ``LATEST_ARTICLES_URL`` to ``load_latest_articles.js``
+instead, which fetches it after the page is shown.
+
+Settings:
+
+* ``LATEST_ARTICLES_COUNT``: number of articles, defaults to 6
+* ``LATEST_ARTICLES_SAVE_AS``: defaults to ``latest_articles.html``
+* ``LATEST_ARTICLES_JSON``: also write the JSON variant, defaults to False
+* ``LATEST_ARTICLES_INLINE``: inline the fragment in the index page instead
+  of loading it with ``load_latest_articles.js``, defaults to True
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import re
+
+from markupsafe import Markup
+from pelican import signals
+from pelican.generators import Generator
+
+logger = logging.getLogger(__name__)
+
+HASH_LENGTH = 8
+
+
+def hashed_name(name, content):
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(name)
+    return '{}.{}{}'.format(base, digest, ext)
+
+
+def write_if_changed(path, content):
+    """ Writes content to path unless the file already has it. Returns True if written."""
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            if f.read() == content:
+                return False
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+class LatestArticlesGenerator(Generator):
+
+    def __init__(self, *args, **kwargs):
+        super(LatestArticlesGenerator, self).__init__(*args, **kwargs)
+        self.count = self.settings.get('LATEST_ARTICLES_COUNT', 6)
+        self.save_as = self.settings.get('LATEST_ARTICLES_SAVE_AS', 'latest_articles.html')
+        self.with_json = self.settings.get('LATEST_ARTICLES_JSON', False)
+        self.context.setdefault('LATEST_ARTICLES_INLINE', True)
+        self.files = {}
+
+    def render(self):
+        """ Renders the fragment, once the articles are final but before any page is written."""
+        articles = self.context['articles'][:self.count]
+        context = dict(self.context)
+        # The fragment is loaded from pages at any depth, links must start at the root
+        context['SITEURL'] = '' if self.settings.get('RELATIVE_URLS') else self.settings['SITEURL']
+        context['latest_articles'] = articles
+        html = self.get_template('latest_articles').render(context)
+
+        hashed = hashed_name(self.save_as, html)
+        self.files = {self.save_as: html, hashed: html}
+        self.context['LATEST_ARTICLES_HTML'] = Markup(html)
+        self.context['LATEST_ARTICLES_URL'] = '{}/{}'.format(context['SITEURL'], hashed)
+
+        if self.with_json:
+            site_url = context['SITEURL']
+            data = json.dumps([{
+                'title': article.title,
+                'url': '{}/{}'.format(site_url, article.url),
+                'date': article.date.isoformat(),
+                'thumbnail': '{}/{}'.format(site_url, article.header_thumbnail)
+                if getattr(article, 'header_thumbnail', None) else None,
+            } for article in articles], separators=(',', ':'), ensure_ascii=False)
+            json_name = os.path.splitext(self.save_as)[0] + '.json'
+            self.files[json_name] = data
+            self.files[hashed_name(json_name, data)] = data
+
+    def generate_output(self, writer):
+        written = [name for name, content in sorted(self.files.items())
+                   if write_if_changed(os.path.join(self.output_path, name), content)]
+        if not written:
+            return
+        logger.info('latest_articles: wrote {}'.format(', '.join(written)))
+
+        # Remove the hashed copies of previous builds
+        folder, name = os.path.split(os.path.join(self.output_path, self.save_as))
+        stale_re = re.compile(r'^{}\.[0-9a-f]{{{}}}\.(html|json)$'.format(
+            re.escape(os.path.splitext(name)[0]), HASH_LENGTH))
+        current = {os.path.basename(f) for f in self.files}
+        for old in os.listdir(folder):
+            if stale_re.match(old) and old not in current:
+                os.remove(os.path.join(folder, old))
+
+
+def render_latest_articles(generators):
+    for generator in generators:
+        if isinstance(generator, LatestArticlesGenerator):
+            generator.render()
+
+
+def get_generators(generators):
+    return LatestArticlesGenerator
+
+
+def register():
+    signals.get_generators.connect(get_generators)
+    signals.all_generators_finalized.connect(render_latest_articles)
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Low Memory
+----------
+
+Build mode for very large content trees, where keeping the HTML of every
+article in memory for the whole build does not fit anymore.
+
+With ``LOW_MEMORY`` enabled, the body of every article is moved to an
+append-only file, ``CACHE_PATH/low_memory/bodies.bin``, as soon as the article
+is read. The article keeps only the offset of its body, which is read back
+from the file each time a template or a plugin asks for it, and the rendered
+content is not memoized either. Peak memory then grows with the largest
+article instead of with the sum of all of them, for a few extra reads of a
+file that is in the OS cache anyway.
+
+The memory used by the build can be followed with ``tracemalloc``. With
+``LOW_MEMORY_REPORT``, the peak of each phase of the build (reading the
+articles, reading the pages, the other generators, writing) is logged at the
+end. With ``LOW_MEMORY_CEILING``, the memory is checked after every page
+written: above the ceiling the memoized contents are dropped, and if that is
+not enough the lines allocating the most are logged as a warning. A peak over
+the ceiling is logged as an error at the end, so ``pelican --fatal errors``
+fails the build.
+
+Tracing allocations slows the build down, so the report and the ceiling are
+meant for investigating, not for every build. The plugin has to be listed last
+in ``PLUGINS`` for the writing phase to include the work the other plugins do
+once the build is finalized.
+
+Settings:
+
+* ``LOW_MEMORY``: move the article bodies to disk, defaults to False
+* ``LOW_MEMORY_CEILING``: memory ceiling in MB, defaults to None
+* ``LOW_MEMORY_REPORT``: log the peak memory of every phase, defaults to False
+"""
+
+from __future__ import unicode_literals
+
+import gc
+import logging
+import os
+import time
+
+from pelican import signals
+from pelican.contents import Article, Content
+
+logger = logging.getLogger(__name__)
+
+MB = 2 ** 20
+TOP_ALLOCATIONS = 5
+
+_spilled_classes = {}
+
+
+class SpillStore(object):
+    """ Append-only file of texts, read back from their (offset, length)."""
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.file = open(path, 'w+b')
+        self.size = 0
+        self.count = 0
+
+    def put(self, text):
+        data = text.encode('utf-8')
+        self.file.seek(self.size)
+        self.file.write(data)
+        location = (self.size, len(data))
+        self.size += len(data)
+        self.count += 1
+        return location
+
+    def get(self, location):
+        offset, length = location
+        self.file.seek(offset)
+        return self.file.read(length).decode('utf-8')
+
+    def close(self):
+        self.file.close()
+
+
+def load_content(self):
+    return store.get(self._spilled)
+
+
+def save_content(self, value):
+    self._spilled = store.put(value)
+
+
+def get_content(self, siteurl):
+    """ Content.get_content without memoization, which would keep every body in memory."""
+    if hasattr(self, '_get_content'):
+        content = self._get_content()
+    else:
+        content = self._content
+    return self._update_content(content, siteurl)
+
+
+def spilled_class(cls):
+    """ Subclass of cls whose _content lives in the store."""
+    if cls not in _spilled_classes:
+        _spilled_classes[cls] = type(cls.__name__, (cls,), {
+            '_content': property(load_content, save_content),
+            'get_content': get_content,
+            '__module__': cls.__module__,
+        })
+    return _spilled_classes[cls]
+
+
+def memoized_caches():
+    return [Content.__dict__[name].cache for name in ('get_content', 'get_summary')]
+
+
+def traced_memory():
+    import tracemalloc
+    return tracemalloc.get_traced_memory()
+
+
+class LowMemory(object):
+
+    def __init__(self):
+        self.building = False
+        self.spill = False
+        self.tracing = False
+
+    def start(self, generator):
+        """ Runs when the first generator of a build is created."""
+        if self.building:
+            return
+        self.building = True
+        settings = generator.settings
+        self.spill = settings.get('LOW_MEMORY', False)
+        if self.spill and settings.get('CACHE_CONTENT', False):
+            logger.warning('low_memory: article bodies are kept in memory, they cannot be '
+                           'spilled when CACHE_CONTENT is enabled')
+            self.spill = False
+        if self.spill:
+            global store
+            if store is not None:
+                store.close()
+            store = SpillStore(os.path.join(settings.get('CACHE_PATH', 'cache'), 'low_memory', 'bodies.bin'))
+
+        ceiling = settings.get('LOW_MEMORY_CEILING')
+        self.ceiling = ceiling * MB if ceiling else None
+        self.report = settings.get('LOW_MEMORY_REPORT', False)
+        self.tracing = bool(self.ceiling or self.report)
+        self.phases = []
+        self.warned = False
+        self.overall_peak = 0
+        if self.tracing:
+            import tracemalloc
+            tracemalloc.start()
+            self.phase_start = time.time()
+
+    def spill_content(self, content):
+        if not self.spill or not isinstance(content, Article) or '_content' not in content.__dict__:
+            return
+        body = content.__dict__.pop('_content')
+        content.__class__ = spilled_class(type(content))
+        content._content = body
+
+    def end_phase(self, name):
+        if not self.tracing:
+            return
+        import tracemalloc
+        current, peak = traced_memory()
+        self.phases.append((name, peak, current, time.time() - self.phase_start))
+        self.overall_peak = max(self.overall_peak, peak)
+        tracemalloc.reset_peak()
+        self.phase_start = time.time()
+
+    def articles_read(self, generator):
+        self.end_phase('reading articles')
+
+    def pages_read(self, generator):
+        self.end_phase('reading pages')
+
+    def before_writing(self, pelican):
+        self.end_phase('other generators')
+
+    def check_ceiling(self, path, context):
+        if not self.ceiling:
+            return
+        current, peak = traced_memory()
+        if current <= self.ceiling:
+            return
+        for cache in memoized_caches():
+            cache.clear()
+        gc.collect()
+        current, peak = traced_memory()
+        if current > self.ceiling and not self.warned:
+            import tracemalloc
+            self.warned = True
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+            logger.warning('low_memory: {:.1f} MB in use while writing {}, over the ceiling of {:.0f} MB. '
+                           'Largest allocations:\n{}'.format(
+                               current / MB, path, self.ceiling / MB, '\n'.join(str(s) for s in statistics)))
+
+    def finish(self, pelican):
+        self.building = False
+        if self.spill:
+            logger.info('low_memory: {} article bodies ({:.1f} MB) kept on disk'.format(
+                store.count, store.size / MB))
+        if not self.tracing:
+            return
+        import tracemalloc
+        self.end_phase('writing')
+        tracemalloc.stop()
+        self.tracing = False
+        if self.report:
+            lines = ['{:<18} {:>10} {:>10} {:>8}'.format('phase', 'peak MB', 'end MB', 'seconds')]
+            for name, peak, current, seconds in self.phases:
+                lines.append('{:<18} {:>10.1f} {:>10.1f} {:>8.2f}'.format(name, peak / MB, current / MB, seconds))
+            logger.info('low_memory: memory used by the build\n' + '\n'.join(lines))
+        if self.ceiling and self.overall_peak > self.ceiling:
+            logger.error('low_memory: the build peaked at {:.1f} MB, over the ceiling of {:.0f} MB'.format(
+                self.overall_peak / MB, self.ceiling / MB))
+
+
+store = None
+low_memory = LowMemory()
+
+
+def register():
+    signals.generator_init.connect(low_memory.start)
+    signals.content_object_init.connect(low_memory.spill_content)
+    signals.article_generator_finalized.connect(low_memory.articles_read)
+    signals.page_generator_finalized.connect(low_memory.pages_read)
+    signals.get_writer.connect(low_memory.before_writing)
+    signals.content_written.connect(low_memory.check_ceiling)
+    signals.finalized.connect(low_memory.finish)
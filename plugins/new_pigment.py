@@ -6,12 +6,6 @@ import re
 from docutils import nodes, utils
 from docutils.parsers.rst import Directive, directives, roles
 
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import TextLexer, get_lexer_by_name
-
-import six
-
 import pelican.settings as pys
 
 
@@ -40,6 +34,12 @@ class Pygments(Directive):
     has_content = True
 
     def run(self):
+        # Imported on the first code block, not when the plugin is loaded
+        from pygments import highlight
+        from pygments.formatters import HtmlFormatter
+        from pygments.lexers import TextLexer, get_lexer_by_name
+        import six
+
         self.assert_has_content()
         try:
             lexer = get_lexer_by_name(self.arguments[0])
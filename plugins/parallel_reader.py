@@ -0,0 +1,594 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel Reader
+---------------
+
+Parses the reStructuredText sources in a pool of processes instead of one
+after the other, docutils being the largest serial step of the build.
+
+When the articles and pages generators are created, the files they are going
+to read are known. The reader of each generator is patched so that, when
+Pelican reads the first file, all the ``.rst`` files of both generators are
+sent to the pool at once; Pelican then gets the HTML and the metadata parsed
+by a worker instead of parsing them again. Files that Pelican takes from its
+own content cache are not sent.
+
+Workers only return plain data (the body and the raw metadata strings), the
+metadata is processed into dates, tags, etc. in the main process, as the
+reader itself would do. The directives and roles registered by the plugins
+(``code-block``, ``sourcecode``, ``newsletter``, ``abbr``) are available in the
+workers: forked processes inherit them, otherwise the plugins are registered
+again when a worker starts. If a worker fails on a file, the file is parsed
+again in the main process, so errors are reported as usual. If the pool
+itself breaks, for instance because its processes cannot start, the remaining
+files are all parsed in the main process.
+
+Generators read their files in the order of a set, this plugin makes it the
+sorted order of the paths. Results are handed over in that order whatever the
+worker that finishes first, so the output is the same on every build.
+
+With ``PARALLEL_READER_WORKERS`` the files are parsed by workers that speak a
+small socket protocol instead of by the pool: the coordinator splits the files
+in shards of ``PARALLEL_READER_SHARD_SIZE`` and hands a shard to every worker
+that is free. Messages are JSON objects preceded by their length on four
+bytes:
+
+* worker: ``{"hello": PROTOCOL_VERSION, "parser": <parser hash>}``
+* coordinator: ``{"shard": [[path relative to PATH, sha1 of the source], ...]}``
+* worker: ``{"documents": [[path, body, raw metadata, error], ...]}``
+
+Workers run ``python -m tools.build_worker`` on a checkout of the site, and
+are listed as ``'host:port'``. A worker whose parser hash differs (other
+plugins, versions or settings), or whose copy of a file differs, is not
+trusted with it. A worker that sends a malformed reply, or none within
+``SHARD_TIMEOUT`` seconds, is dropped and its shard is handed to another one.
+The documents are stored in the cache described below, keyed by the hash of
+their inputs, whichever worker parsed them. ``'local'`` starts
+``PARALLEL_READER_PROCESSES`` workers on this machine, connected by socket
+pairs, which exercises the same protocol without any network service. A
+file that a worker could not parse, or whose worker was lost, is parsed in the
+main process.
+
+The parsed documents are also kept between builds, in
+``CACHE_PATH/reader``. An entry is keyed by the hash of the source, of the
+code of the modules that define the registered directives and roles, of the
+versions of docutils, Pelican and Pygments and of the settings that change the
+HTML (``READER_CACHE_SETTINGS``). A rebuild only parses the files whose entry
+is missing, the others never reach docutils. ``CACHE_VERSION`` invalidates all
+the entries at once when the format changes. Once the cache grows over
+``READER_CACHE_MAX_SIZE``, the entries used least recently are removed.
+
+Settings:
+
+* ``PARALLEL_READER_PROCESSES``: number of worker processes, defaults to the
+  number of CPUs. 1 parses in the main process.
+* ``PARALLEL_READER_WORKERS``: list of ``'host:port'`` of the workers, or
+  ``'local'``, defaults to None (use the pool)
+* ``PARALLEL_READER_SHARD_SIZE``: files per shard, defaults to 8
+* ``READER_CACHE``: keep the parsed documents between builds, defaults to True
+* ``READER_CACHE_MAX_SIZE``: size of the cache in bytes, defaults to 100 MB
+* ``READER_CACHE_SETTINGS``: settings the HTML depends on, defaults to
+  ``['DEFAULT_LANG', 'DOCUTILS_SETTINGS', 'FORMATTED_FIELDS', 'PYGMENTS_RST_OPTIONS']``
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import queue
+import socket
+import struct
+import sys
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from pelican import signals
+from pelican.plugins._utils import load_legacy_plugin
+from pelican.readers import RstReader
+
+metrics = load_legacy_plugin('build_metrics', [os.path.dirname(os.path.realpath(__file__))])
+
+logger = logging.getLogger(__name__)
+
+# Counted in the main process, whichever process parsed the document
+cached_documents = metrics.counter('parallel_reader_cached_documents_total', 'Documents taken from the reader cache')
+worker_documents = metrics.counter('parallel_reader_worker_documents_total', 'Documents parsed by a worker')
+main_documents = metrics.counter('parallel_reader_main_documents_total', 'Documents parsed in the main process')
+wait_time = metrics.timer('parallel_reader_wait_seconds', 'Time spent waiting for a worker to parse a document')
+parse_time = metrics.timer('parallel_reader_parse_seconds', 'Time to parse a document in the main process')
+
+# Below this number of files the pool costs more than it saves
+MIN_PARALLEL_FILES = 8
+# Bump when the format of the cached documents changes
+CACHE_VERSION = 1
+CACHED_VERSIONS = ('docutils', 'pelican', 'Pygments')
+CACHED_SETTINGS = ['DEFAULT_LANG', 'DOCUTILS_SETTINGS', 'FORMATTED_FIELDS', 'PYGMENTS_RST_OPTIONS']
+# Bump when the messages between the coordinator and the workers change
+PROTOCOL_VERSION = 1
+SHARD_SIZE = 8
+# Seconds to wait for a remote worker to connect, and then to parse a shard
+CONNECT_TIMEOUT = 10
+SHARD_TIMEOUT = 600
+
+# Reader of the worker process, created by init_worker
+_worker_reader = None
+
+
+def raw_metadata(name, value):
+    """ Stands for process_metadata in the workers, values are processed later."""
+    return value
+
+
+def init_worker(reader_class, settings, register_plugins):
+    global _worker_reader
+    if register_plugins:
+        from pelican.plugins._utils import load_plugins
+        for plugin in load_plugins(settings):
+            plugin.register()
+    _worker_reader = reader_class(settings)
+    _worker_reader.process_metadata = raw_metadata
+
+
+def read_source(path):
+    """ Returns (body, raw metadata) of a source file. Runs in the worker processes."""
+    return _worker_reader.read(path)
+
+
+def read_raw(reader, read, path):
+    """ Calls read with the metadata left unprocessed, as in the workers."""
+    reader.process_metadata = raw_metadata
+    try:
+        return read(path)
+    finally:
+        del reader.process_metadata
+
+
+def parser_hash(reader):
+    """ Hashes what, besides the source, the HTML of a document depends on."""
+    from importlib import metadata
+    from docutils.parsers.rst import directives, roles
+
+    digest = hashlib.sha1('{}:{}.{}'.format(
+        CACHE_VERSION, type(reader).__module__, type(reader).__name__).encode('utf-8'))
+    for package in CACHED_VERSIONS:
+        try:
+            digest.update('{}={}'.format(package, metadata.version(package)).encode('utf-8'))
+        except metadata.PackageNotFoundError:
+            pass
+    files = set()
+    # Directives and roles registered by the plugins, docutils is covered by its version
+    for registered in (directives._directives, roles._roles):
+        for obj in registered.values():
+            try:
+                files.add(inspect.getfile(obj if inspect.isclass(obj) or inspect.isfunction(obj) else type(obj)))
+            except TypeError:
+                continue
+    for path in sorted(files):
+        if os.path.isfile(path) and '{0}docutils{0}'.format(os.sep) not in path:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    settings = {key: reader.settings.get(key) for key in reader.settings.get('READER_CACHE_SETTINGS', CACHED_SETTINGS)}
+    digest.update(json.dumps(settings, sort_keys=True, default=repr).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ReaderCache(object):
+    """ Parsed documents, stored one per file under the hash of their inputs."""
+
+    def __init__(self, settings, reader):
+        self.enabled = settings.get('READER_CACHE', True)
+        self.folder = os.path.join(settings.get('CACHE_PATH', 'cache'), 'reader')
+        self.max_size = settings.get('READER_CACHE_MAX_SIZE', 100 * 2 ** 20)
+        self.prefix = parser_hash(reader).encode('utf-8') if self.enabled else b''
+        self.keys = {}
+        self.hits = 0
+
+    def entry(self, path):
+        if path not in self.keys:
+            with open(path, 'rb') as f:
+                key = hashlib.sha1(self.prefix + f.read()).hexdigest()
+            self.keys[path] = os.path.join(self.folder, key[:2], key + '.pickle')
+        return self.keys[path]
+
+    def has(self, path):
+        return self.enabled and os.path.isfile(self.entry(path))
+
+    def load(self, path):
+        """ Returns the cached (body, raw metadata) of a source file, or None."""
+        if not self.enabled:
+            return None
+        entry = self.entry(path)
+        try:
+            with open(entry, 'rb') as f:
+                version, document = pickle.load(f)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if version != CACHE_VERSION:
+            return None
+        # The modification time tells the least recently used entries
+        os.utime(entry)
+        self.hits += 1
+        return document
+
+    def store(self, path, document):
+        if not self.enabled:
+            return
+        entry = self.entry(path)
+        if not os.path.isdir(os.path.dirname(entry)):
+            os.makedirs(os.path.dirname(entry))
+        with open(entry + '.tmp', 'wb') as f:
+            pickle.dump((CACHE_VERSION, document), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(entry + '.tmp', entry)
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache fits in max_size."""
+        if not self.enabled or not os.path.isdir(self.folder):
+            return
+        entries = []
+        for root, dirs, files in os.walk(self.folder):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        size = sum(e[1] for e in entries)
+        removed = 0
+        for mtime, entry_size, entry in sorted(entries):
+            if size <= self.max_size:
+                break
+            os.remove(entry)
+            size -= entry_size
+            removed += 1
+        if removed:
+            logger.info('parallel_reader: removed {} documents from the cache'.format(removed))
+
+
+def send_message(connection, message):
+    data = json.dumps(message).encode('utf-8')
+    connection.sendall(struct.pack('>I', len(data)) + data)
+
+
+def receive_exactly(connection, size):
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def receive_message(connection):
+    """ Returns the next message, or None once the other side closed the connection."""
+    header = receive_exactly(connection, 4)
+    if header is None:
+        return None
+    data = receive_exactly(connection, struct.unpack('>I', header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+def source_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def serve_connection(connection, reader, content_path, cache=None):
+    """ Parses the shards sent by a coordinator until it closes the connection. Runs in the workers.
+
+    The process_metadata of reader must be raw_metadata.
+    """
+    send_message(connection, {'hello': PROTOCOL_VERSION, 'parser': parser_hash(reader)})
+    while True:
+        message = receive_message(connection)
+        if message is None or 'shard' not in message:
+            return
+        documents = []
+        for name, sha in message['shard']:
+            path = os.path.join(content_path, name)
+            try:
+                if source_hash(path) != sha:
+                    raise ValueError('the source differs from the one of the coordinator')
+                document = cache.load(path) if cache is not None else None
+                if document is None:
+                    document = reader.read(path)
+                    if cache is not None:
+                        cache.store(path, document)
+                documents.append([name, document[0], document[1], None])
+            except Exception as e:
+                documents.append([name, None, None, '{}: {}'.format(type(e).__name__, e)])
+        send_message(connection, {'documents': documents})
+
+
+def local_worker(connection, reader_class, settings, register_plugins):
+    """ Worker process of the 'local' stand-in, talking to the coordinator over a socket pair."""
+    init_worker(reader_class, settings, register_plugins)
+    try:
+        serve_connection(connection, _worker_reader, settings['PATH'])
+    finally:
+        connection.close()
+
+
+class Coordinator(object):
+    """ Hands the shards of files out to the workers and collects their documents in futures."""
+
+    def __init__(self, reader, workers, processes, shard_size=SHARD_SIZE):
+        self.reader = reader
+        self.content_path = reader.settings['PATH']
+        self.parser = parser_hash(reader)
+        self.shard_size = shard_size
+        self.shards = queue.Queue()
+        self.futures = {}
+        self.connections = []
+        self.processes = []
+        self.threads = []
+        self.lock = threading.Lock()
+        self.active = 0
+        if workers == 'local':
+            self.start_local(processes)
+        else:
+            self.connect(workers)
+
+    def start_local(self, processes):
+        context = multiprocessing.get_context()
+        register_plugins = context.get_start_method() != 'fork'
+        for i in range(processes):
+            ours, theirs = socket.socketpair()
+            process = context.Process(target=local_worker, daemon=True, args=(
+                theirs, type(self.reader), self.reader.settings, register_plugins))
+            process.start()
+            theirs.close()
+            ours.settimeout(SHARD_TIMEOUT)
+            self.processes.append(process)
+            self.connections.append(('local worker {}'.format(i + 1), ours))
+
+    def connect(self, workers):
+        for address in workers:
+            host, port = address.rsplit(':', 1)
+            try:
+                connection = socket.create_connection((host, int(port)), CONNECT_TIMEOUT)
+            except OSError as e:
+                logger.warning('parallel_reader: could not connect to the worker {}: {}'.format(address, e))
+                continue
+            connection.settimeout(SHARD_TIMEOUT)
+            self.connections.append((address, connection))
+
+    def submit(self, paths):
+        """ Returns {path: future of its (body, raw metadata)}."""
+        from concurrent.futures import Future
+
+        futures = {path: Future() for path in paths}
+        self.futures.update(futures)
+        for i in range(0, len(paths), self.shard_size):
+            self.shards.put(paths[i:i + self.shard_size])
+        self.active = len(self.connections)
+        if not self.connections:
+            self.abandon()
+        for name, connection in self.connections:
+            thread = threading.Thread(target=self.drive, args=(name, connection), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return futures
+
+    def drive(self, name, connection):
+        """ Feeds a worker with shards until there are none left."""
+        try:
+            hello = receive_message(connection)
+            if not hello or hello.get('hello') != PROTOCOL_VERSION or hello.get('parser') != self.parser:
+                logger.warning('parallel_reader: {} does not parse with the same plugins, versions '
+                               'and settings as this build, not using it'.format(name))
+                return
+            while True:
+                try:
+                    shard = self.shards.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    names = [os.path.relpath(path, self.content_path) for path in shard]
+                    send_message(connection, {'shard': [
+                        [name, source_hash(path)] for name, path in zip(names, shard)]})
+                    documents = self.check_reply(names, receive_message(connection))
+                except Exception:
+                    # Another worker takes it, or the main process
+                    self.shards.put(shard)
+                    raise
+                for path, (content, metadata, error) in zip(shard, documents):
+                    if error is None:
+                        self.futures[path].set_result((content, metadata))
+                    else:
+                        self.futures[path].set_exception(RuntimeError(error))
+        except Exception as e:
+            logger.warning('parallel_reader: lost {}: {}'.format(name, e))
+        finally:
+            connection.close()
+            with self.lock:
+                self.active -= 1
+                last = not self.active
+            if last:
+                self.abandon()
+
+    @staticmethod
+    def check_reply(names, reply):
+        """ Returns [(body, raw metadata, error), ...] of the files names from the reply of a worker."""
+        if reply is None:
+            raise ConnectionError('connection closed')
+        documents = reply.get('documents') if isinstance(reply, dict) else None
+        if not isinstance(documents, list) or len(documents) != len(names):
+            raise ValueError('expected {} documents in the reply'.format(len(names)))
+        checked = []
+        for name, document in zip(names, documents):
+            if not isinstance(document, list) or len(document) != 4 or document[0] != name:
+                raise ValueError('unexpected document in the reply for {}'.format(name))
+            checked.append(document[1:])
+        return checked
+
+    def abandon(self):
+        """ Fails the shards no worker is left to take, they are parsed in the main process."""
+        while True:
+            try:
+                shard = self.shards.get_nowait()
+            except queue.Empty:
+                return
+            for path in shard:
+                self.futures[path].set_exception(RuntimeError('no worker left'))
+
+    def close(self):
+        for name, connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self.threads:
+            thread.join()
+        for process in self.processes:
+            process.join(CONNECT_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+
+def sort_files(generator):
+    """ Makes get_files of a generator return a sorted list instead of a set."""
+    get_files = generator.get_files
+
+    def sorted_files(*args, **kwargs):
+        return sorted(get_files(*args, **kwargs))
+    generator.get_files = sorted_files
+
+
+class ParallelReader(object):
+
+    def __init__(self):
+        self.pending = []
+        self.futures = {}
+        self.executor = None
+        self.coordinator = None
+        self.cache = None
+
+    def prepare(self, generator, paths_setting, excludes_setting):
+        """ Lists the files a generator will parse and patches its rst reader."""
+        settings = generator.settings
+        self.processes = settings.get('PARALLEL_READER_PROCESSES') or os.cpu_count() or 1
+        readers = generator.readers
+        extensions = [ext for ext, reader in readers.readers.items() if isinstance(reader, RstReader)]
+        if not extensions:
+            return
+        if self.cache is None:
+            self.cache = ReaderCache(settings, readers.readers[extensions[0]])
+        sort_files(generator)
+
+        for f in generator.get_files(settings[paths_setting], exclude=settings[excludes_setting],
+                                     extensions=extensions):
+            path = os.path.abspath(os.path.join(generator.path, f))
+            # Pelican takes it from its cache, no need to parse it
+            if generator.get_cached_data(f, None) is not None or readers.get_cached_data(path, None):
+                continue
+            if not self.cache.has(path):
+                self.pending.append(path)
+        for ext in extensions:
+            self.patch(readers.readers[ext])
+
+    def prepare_articles(self, generator):
+        self.prepare(generator, 'ARTICLE_PATHS', 'ARTICLE_EXCLUDES')
+
+    def prepare_pages(self, generator):
+        self.prepare(generator, 'PAGE_PATHS', 'PAGE_EXCLUDES')
+
+    def patch(self, reader):
+        read = reader.read
+
+        def parallel_read(path):
+            return self.read(reader, read, path)
+        reader.read = parallel_read
+
+    def start(self, reader):
+        """ Sends all the pending files to the pool."""
+        paths, self.pending = sorted(set(self.pending)), []
+        workers = reader.settings.get('PARALLEL_READER_WORKERS')
+        if workers and len(paths) >= MIN_PARALLEL_FILES:
+            shard_size = reader.settings.get('PARALLEL_READER_SHARD_SIZE', SHARD_SIZE)
+            self.coordinator = Coordinator(reader, workers, self.processes, shard_size)
+            self.futures.update(self.coordinator.submit(paths))
+            logger.info('parallel_reader: parsing {} files in shards of {} on {} workers'.format(
+                len(paths), shard_size, len(self.coordinator.connections)))
+            return
+        if self.processes < 2 or len(paths) < MIN_PARALLEL_FILES:
+            return
+        from concurrent.futures import ProcessPoolExecutor
+
+        register_plugins = multiprocessing.get_start_method() != 'fork'
+        workers = min(self.processes, len(paths))
+        self.executor = ProcessPoolExecutor(
+            workers, initializer=init_worker,
+            initargs=(type(reader), reader.settings, register_plugins))
+        for path in paths:
+            self.futures[path] = self.executor.submit(read_source, path)
+        logger.info('parallel_reader: parsing {} files in {} processes'.format(
+            len(paths), workers))
+
+    def read(self, reader, read, path):
+        document = self.cache.load(path)
+        if document is None:
+            if self.pending:
+                self.start(reader)
+            future = self.futures.pop(path, None)
+            if future is not None:
+                try:
+                    with wait_time.time():
+                        document = future.result()
+                    worker_documents.inc()
+                except BrokenProcessPool as e:
+                    logger.warning('parallel_reader: the worker processes failed ({}), parsing the remaining '
+                                   'files in the main process'.format(e))
+                    self.stop_pool()
+                except Exception as e:
+                    logger.warning('parallel_reader: {} failed in a worker ({}), parsing it again'.format(path, e))
+            if document is None:
+                with parse_time.time():
+                    document = read_raw(reader, read, path)
+                main_documents.inc()
+            self.cache.store(path, document)
+        else:
+            cached_documents.inc()
+        content, metadata = document
+        return content, {name: reader.process_metadata(name, value) for name, value in metadata.items()}
+
+    def stop_pool(self):
+        """ Stops the pool, its futures that did not succeed are parsed in the main process."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = None
+        self.futures = {path: future for path, future in self.futures.items()
+                        if future.done() and not future.cancelled() and future.exception() is None}
+
+    def stop(self, generators):
+        self.pending = []
+        self.futures = {}
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        if self.coordinator is not None:
+            self.coordinator.close()
+            self.coordinator = None
+        if self.cache is not None:
+            if self.cache.hits:
+                logger.info('parallel_reader: {} documents taken from the cache'.format(self.cache.hits))
+            self.cache.evict()
+            self.cache = None
+
+
+parallel_reader = ParallelReader()
+
+
+def register():
+    # Worker processes import this module by name, the processes started by
+    # spawn get the sys.path of this one
+    plugin_dir = os.path.dirname(os.path.realpath(__file__))
+    if plugin_dir not in sys.path:
+        sys.path.append(plugin_dir)
+    signals.article_generator_init.connect(parallel_reader.prepare_articles)
+    signals.page_generator_init.connect(parallel_reader.prepare_pages)
+    signals.all_generators_finalized.connect(parallel_reader.stop)
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Related Articles
+----------------
+
+Adds ``related_articles`` to every article: the list of the most similar
+articles, to be shown at the end of the page.
+
+Each article is turned into a TF-IDF vector (sublinear term frequency, title
+and tags weighted higher than the body). All the vectors are stacked in a
+sparse matrix, and the cosine similarities of every article against all the
+others are computed with a single sparse matrix product, in blocks of rows
+to bound the memory used.
+
+Tokenizing is the expensive part, so the term counts of each article are
+stored in ``CACHE_PATH/related_articles.pickle`` next to the hash of its
+source. On a new build only the articles that changed are tokenized again;
+the matrix itself is cheap to rebuild.
+
+Requires NumPy and SciPy, without them the plugin does nothing.
+
+Settings:
+
+* ``RELATED_ARTICLES_COUNT``: number of related articles, defaults to 5
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import os
+import pickle
+import re
+
+from collections import Counter
+from pelican import signals
+
+logger = logging.getLogger(__name__)
+
+# Bump when the tokenizer changes, to invalidate the cached term counts
+CACHE_VERSION = 1
+BLOCK_SIZE = 1024
+TITLE_WEIGHT = 3
+TAG_WEIGHT = 3
+
+_tag_re = re.compile(r'<[^>]+>')
+_token_re = re.compile(r'[a-z][a-z0-9_]{2,}')
+
+STOPWORDS = frozenset("""
+about above after again against all also and any are because been before being below between both
+but can could did does doing down during each few for from further had has have having her here
+hers herself him himself his how into its itself just let more most much must myself nor not now
+off once only other our ours ourselves out over own same she should some such than that the their
+theirs them themselves then there these they this those through too under until very was were
+what when where which while who whom why will with would you your yours yourself yourselves
+one two use used using way can get got like make many may might need new see want well
+""".split())
+
+
+def term_counts(article):
+    """ Returns the weighted term frequencies of an article."""
+    counts = Counter()
+    for text, weight in ((article.title, TITLE_WEIGHT),
+                         (' '.join(tag.name for tag in getattr(article, 'tags', [])), TAG_WEIGHT),
+                         (article._content, 1)):
+        for token in _token_re.findall(_tag_re.sub(' ', text).lower()):
+            if token not in STOPWORDS:
+                counts[token] += weight
+    return counts
+
+
+def article_hash(article):
+    tags = ','.join(tag.name for tag in getattr(article, 'tags', []))
+    data = '\0'.join((article.title, tags, article._content))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def load_cache(path):
+    try:
+        with open(path, 'rb') as f:
+            version, cache = pickle.load(f)
+        if version == CACHE_VERSION:
+            return cache
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        pass
+    return {}
+
+
+def save_cache(cache, path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    with open(path, 'wb') as f:
+        pickle.dump((CACHE_VERSION, cache), f, pickle.HIGHEST_PROTOCOL)
+
+
+def tfidf_matrix(all_counts):
+    """ Builds the L2 normalized TF-IDF CSR matrix, one row per article."""
+    import numpy as np
+    from scipy import sparse
+
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for counts in all_counts:
+        for term, count in counts.items():
+            indices.append(vocabulary.setdefault(term, len(vocabulary)))
+            data.append(count)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int64), np.asarray(indptr)),
+        shape=(len(all_counts), len(vocabulary)))
+    # Sublinear tf and smoothed idf
+    matrix.data = 1 + np.log(matrix.data)
+    document_frequency = np.bincount(matrix.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(all_counts)) / (1 + document_frequency)) + 1
+    matrix = matrix.multiply(idf).tocsr()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms).dot(matrix).tocsr()
+
+
+def top_neighbours(matrix, count):
+    """ Returns, for every row, the indices of the count most similar other rows."""
+    import numpy as np
+
+    n_rows = matrix.shape[0]
+    count = min(count, n_rows - 1)
+    if count <= 0:
+        return [[] for _ in range(n_rows)]
+    transposed = matrix.T.tocsc()
+    neighbours = []
+    for start in range(0, n_rows, BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, n_rows)
+        similarity = matrix[start:stop].dot(transposed).toarray()
+        # An article is not related to itself
+        similarity[np.arange(stop - start), np.arange(start, stop)] = -1
+        best = np.argpartition(-similarity, count - 1, axis=1)[:, :count]
+        scores = np.take_along_axis(similarity, best, axis=1)
+        order = np.argsort(-scores, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        for row, row_scores in zip(best, scores):
+            neighbours.append([int(i) for i, score in zip(row, row_scores) if score > 0])
+    return neighbours
+
+
+def add_related_articles(generator):
+    try:
+        import numpy  # noqa
+        import scipy  # noqa
+    except ImportError:
+        logger.warning('related_articles: NumPy and SciPy are needed to find related articles')
+        return
+
+    articles = generator.articles
+    if not articles:
+        return
+    cache_path = os.path.join(generator.settings.get('CACHE_PATH', 'cache'), 'related_articles.pickle')
+    cache = load_cache(cache_path)
+    new_cache = {}
+    all_counts = []
+    tokenized = 0
+    for article in articles:
+        digest = article_hash(article)
+        cached = cache.get(article.source_path)
+        if cached is not None and cached[0] == digest:
+            counts = cached[1]
+        else:
+            counts = term_counts(article)
+            tokenized += 1
+        new_cache[article.source_path] = (digest, counts)
+        all_counts.append(counts)
+    save_cache(new_cache, cache_path)
+
+    count = generator.settings.get('RELATED_ARTICLES_COUNT', 5)
+    neighbours = top_neighbours(tfidf_matrix(all_counts), count)
+    for article, indices in zip(articles, neighbours):
+        article.related_articles = [articles[i] for i in indices]
+    logger.info('related_articles: {} articles, {} tokenized again'.format(len(articles), tokenized))
+
+
+def register():
+    signals.article_generator_finalized.connect(add_related_articles)
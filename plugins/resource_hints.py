@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Resource Hints
+--------------
+
+Adds ``<link rel="preload">`` and ``<link rel="prefetch">`` to the head of the
+pages, from what the build already knows about them:
+
+* preload: the header image of an article, the thumbnails of the first row of
+  an index page, and the theme scripts loaded at the end of the body, so they
+  are downloaded while the page is still being parsed;
+* prefetch: the next page of an index and the first articles it lists, or the
+  first related articles of an article (see ``related_articles``), with their
+  header images. Browsers fetch them once they are idle, so the next click is
+  served from the cache.
+
+The hints are added in the pass of ``html_pipeline``, after the other plugins
+changed the URLs of the assets, so the plugin must be listed after
+``asset_fingerprint`` in ``PLUGINS``. URLs already preloaded by another plugin
+(such as ``critical_css``) are not repeated.
+
+Settings:
+
+* ``RESOURCE_HINTS_PREFETCH``: number of articles to prefetch, defaults to 2
+* ``RESOURCE_HINTS_THUMBNAILS``: number of thumbnails to preload on index
+  pages, defaults to 3
+"""
+
+from __future__ import unicode_literals
+
+import logging
+import os
+import re
+
+from pelican import signals
+from pelican.plugins._utils import load_legacy_plugin
+
+pipeline = load_legacy_plugin('html_pipeline', [os.path.dirname(os.path.realpath(__file__))])
+
+logger = logging.getLogger(__name__)
+
+_body_re = re.compile(r'<body[\s>]', re.IGNORECASE)
+_script_re = re.compile(r'<script[^>]*\ssrc=["\']?([^"\'\s>]+)', re.IGNORECASE)
+_preload_re = re.compile(r'<link[^>]*\srel=["\']?preload[^>]*>', re.IGNORECASE)
+_href_re = re.compile(r'\shref=["\']?([^"\'\s>]+)', re.IGNORECASE)
+_head_end_re = re.compile(r'</head>', re.IGNORECASE)
+
+
+def image_tag(rel, url):
+    return '<link rel="{}" href="{}" as="image"/>'.format(rel, url)
+
+
+class ResourceHints(object):
+
+    def __init__(self):
+        self.static_dir = None
+
+    def initialize(self, pelican):
+        settings = pelican.settings
+        self.static_dir = settings.get('THEME_STATIC_DIR', 'theme')
+        self.prefetch_count = settings.get('RESOURCE_HINTS_PREFETCH', 2)
+        self.thumbnails = settings.get('RESOURCE_HINTS_THUMBNAILS', 3)
+
+    def hints(self, html, context):
+        """ Returns the lists (preload, prefetch) of tags for a page."""
+        siteurl = context.get('SITEURL', '')
+        preload, prefetch = [], []
+        article = context.get('article')
+        page = context.get('articles_page')
+
+        if article is not None:
+            image = getattr(article, 'illustration', None)
+            if image:
+                preload.append(image_tag('preload', '{}/{}'.format(siteurl, image)))
+            neighbours = (getattr(article, 'related_articles', None) or [])[:self.prefetch_count]
+        elif page is not None:
+            listed = page.object_list
+            for item in listed[:self.thumbnails]:
+                image = getattr(item, 'header_thumbnail', None)
+                if image:
+                    preload.append(image_tag('preload', '{}/{}'.format(siteurl, image)))
+            if page.has_next() and context.get('articles_next_page') is not None:
+                prefetch.append('<link rel="prefetch" href="{}/{}"/>'.format(
+                    siteurl, context['articles_next_page'].url))
+            neighbours = listed[:self.prefetch_count]
+        else:
+            return [], []
+
+        for item in neighbours:
+            prefetch.append('<link rel="prefetch" href="{}/{}"/>'.format(siteurl, item.url))
+            image = getattr(item, 'illustration', None)
+            if image:
+                prefetch.append(image_tag('prefetch', '{}/{}'.format(siteurl, image)))
+
+        body = _body_re.search(html)
+        if body:
+            for url in _script_re.findall(html, body.start()):
+                if '/{}/'.format(self.static_dir) in url or url.startswith(self.static_dir + '/'):
+                    preload.append('<link rel="preload" href="{}" as="script"/>'.format(url))
+        return preload, prefetch
+
+    def add_hints(self, path, context, html):
+        if self.static_dir is None:
+            return html
+        head_end = _head_end_re.search(html)
+        if not head_end:
+            return html
+        preload, prefetch = self.hints(html, context)
+        preloaded = set()
+        for tag in _preload_re.findall(html, 0, head_end.start()):
+            preloaded.update(_href_re.findall(tag))
+        tags = []
+        for tag in preload + prefetch:
+            href = _href_re.search(tag).group(1)
+            if href not in preloaded:
+                preloaded.add(href)
+                tags.append(tag)
+        if not tags:
+            return html
+        return html[:head_end.start()] + ''.join(tags) + html[head_end.start():]
+
+
+resource_hints = ResourceHints()
+
+
+def register():
+    signals.initialized.connect(resource_hints.initialize)
+    pipeline.add_step(resource_hints.add_hints)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Service Worker
+--------------
+
+Writes ``sw.js``, a service worker that keeps a copy of the files a returning
+visitor needs, and ``precache-manifest.json``, the list of those files with
+their revision:
+
+* the home page, the blog index and the ``SERVICE_WORKER_ARTICLES`` latest
+  articles,
+* the theme assets those pages load (bundles, stylesheets, fonts, images),
+* ``tipuesearch_content.json``.
+
+The theme assets are the ones already renamed after their hash by the
+asset_bundler and asset_fingerprint plugins, so their revision is the hash in
+their name. Only the pages and the search index are hashed here.
+
+The manifest is embedded in ``sw.js``, so any change produces a new service
+worker, which browsers install on their next visit. On install, the files
+whose revision did not change are copied from the previous cache and only
+the others are downloaded. Requests for a precached URL are then answered from
+the cache first.
+
+The pages are hashed once the build is finalized, as they are deployed,
+after the plugins of ``html_pipeline`` rewrote them. The theme registers the
+worker when ``SERVICE_WORKER`` is True.
+
+Settings:
+
+* ``SERVICE_WORKER``: enables the plugin, defaults to False
+* ``SERVICE_WORKER_ARTICLES``: number of latest articles to precache,
+  defaults to 10
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import re
+
+from pelican import signals
+
+logger = logging.getLogger(__name__)
+
+HASH_LENGTH = 8
+WORKER_NAME = 'sw.js'
+MANIFEST_NAME = 'precache-manifest.json'
+SEARCH_INDEX = 'tipuesearch_content.json'
+
+WORKER_SOURCE = """// Generated by plugins/service_worker.py, changes are overwritten on every build
+const VERSION = '%(version)s';
+const PRECACHE = 'precache-' + VERSION;
+// URL -> revision
+const MANIFEST = %(manifest)s;
+
+function cacheKey(url) {
+    return url + '?__rev=' + MANIFEST[url];
+}
+
+function precachedUrl(request) {
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin || url.search) {
+        return null;
+    }
+    let path = url.pathname;
+    if (!(path in MANIFEST) && path.endsWith('/')) {
+        path = path.slice(0, -1) || '/';
+    }
+    return path in MANIFEST ? path : null;
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil((async () => {
+        const cache = await caches.open(PRECACHE);
+        await Promise.all(Object.keys(MANIFEST).map(async url => {
+            // Unchanged files come from the cache of the previous version
+            let response = await caches.match(cacheKey(url));
+            if (!response) {
+                response = await fetch(url, {cache: 'no-cache'});
+                if (!response.ok) {
+                    throw new Error(url + ': ' + response.status);
+                }
+                if (response.redirected) {
+                    // Browsers refuse redirected responses for navigations
+                    response = new Response(await response.blob(), {
+                        status: response.status, statusText: response.statusText, headers: response.headers});
+                }
+            }
+            await cache.put(cacheKey(url), response);
+        }));
+        await self.skipWaiting();
+    })());
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil((async () => {
+        for (const name of await caches.keys()) {
+            if (name.startsWith('precache-') && name !== PRECACHE) {
+                await caches.delete(name);
+            }
+        }
+        await self.clients.claim();
+    })());
+});
+
+self.addEventListener('fetch', event => {
+    const url = precachedUrl(event.request);
+    if (url === null) {
+        return;
+    }
+    event.respondWith(caches.open(PRECACHE)
+        .then(cache => cache.match(cacheKey(url)))
+        .then(response => response || fetch(event.request)));
+});
+"""
+
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:HASH_LENGTH]
+
+
+def write_if_changed(path, text):
+    if os.path.isfile(path):
+        with open(path, encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return True
+
+
+class ServiceWorker(object):
+
+    def __init__(self):
+        self.articles = []
+
+    def collect_articles(self, generator):
+        count = generator.settings.get('SERVICE_WORKER_ARTICLES', 10)
+        # Articles are sorted newest first by now
+        self.articles = [(article.url, article.save_as) for article in generator.articles[:count]]
+
+    def write(self, pelican):
+        articles, self.articles = self.articles, []
+        settings = pelican.settings
+        if not settings.get('SERVICE_WORKER', False):
+            return
+        output_path = pelican.output_path
+        static_dir = settings.get('THEME_STATIC_DIR', 'theme')
+        hashed_re = re.compile(r'(?<=/)(%s/[^"\'?#)\s]+?\.([0-9a-f]{%d})\.[A-Za-z0-9]+)(?=["\'?#)\s])' % (
+            re.escape(static_dir), HASH_LENGTH))
+
+        manifest = {}
+        pages = [('', 'index.html'), ('blog/', settings.get('INDEX_SAVE_AS', 'index.html'))] + articles
+        for url, save_as in pages:
+            path = os.path.join(output_path, save_as)
+            if not os.path.isfile(path):
+                continue
+            manifest['/' + url] = file_hash(path)
+            with open(path, encoding='utf-8') as f:
+                for name, digest in hashed_re.findall(f.read()):
+                    if os.path.isfile(os.path.join(output_path, name)):
+                        manifest['/' + name] = digest
+        if os.path.isfile(os.path.join(output_path, SEARCH_INDEX)):
+            manifest['/' + SEARCH_INDEX] = file_hash(os.path.join(output_path, SEARCH_INDEX))
+
+        entries = json.dumps(manifest, indent=1, sort_keys=True)
+        version = hashlib.sha1(entries.encode('utf-8')).hexdigest()[:HASH_LENGTH]
+        write_if_changed(os.path.join(output_path, MANIFEST_NAME),
+                         json.dumps({'version': version, 'entries': manifest}, indent=1, sort_keys=True))
+        if write_if_changed(os.path.join(output_path, WORKER_NAME),
+                            WORKER_SOURCE % {'version': version, 'manifest': entries}):
+            logger.info('service_worker: version {} precaching {} files'.format(version, len(manifest)))
+
+
+service_worker = ServiceWorker()
+
+
+def register():
+    signals.article_generator_finalized.connect(service_worker.collect_articles)
+    signals.finalized.connect(service_worker.write)
@@ -13,13 +13,15 @@ import collections
 import os.path
 
 from datetime import datetime
-from logging import warning, info
+from logging import warning
 from codecs import open
-from pytz import timezone
 
 from pelican import signals, contents
+from pelican.plugins._utils import load_legacy_plugin
 from pelican.utils import get_date
 
+metrics = load_legacy_plugin('build_metrics', [os.path.dirname(os.path.dirname(os.path.realpath(__file__)))])
+
 TXT_HEADER = """{0}/index.html
 {0}/archives.html
 {0}/tags.html
@@ -45,6 +47,9 @@ XML_FOOTER = """
 </urlset>
 """
 
+urls_written = metrics.counter('sitemap_urls_total', 'URLs written to the sitemap')
+write_time = metrics.timer('sitemap_write_seconds', 'Time to write the sitemap')
+
 
 def format_date(date):
     if date.tzinfo:
@@ -58,6 +63,8 @@ class SitemapGenerator(object):
 
     def __init__(self, context, settings, path, theme, output_path, *null):
 
+        from pytz import timezone
+
         self.output_path = output_path
         self.context = context
         self.now = datetime.now()
@@ -178,8 +185,10 @@ class SitemapGenerator(object):
                     break
             if not flag:
                 fd.write(XML_URL.format(self.siteurl, pageurl, lastmod, chfreq, pri))
+                urls_written.inc()
         else:
             fd.write(self.siteurl + '/' + pageurl + '\n')
+            urls_written.inc()
 
     def get_date_modified(self, page, default):
         if hasattr(page, 'modified'):
@@ -217,8 +226,7 @@ class SitemapGenerator(object):
         for article in self.context['articles']:
             pages += article.translations
 
-        info('writing {0}'.format(path))
-
+        timing = write_time.start()
         with open(path, 'w', encoding='utf-8') as fd:
 
             if self.format == 'xml':
@@ -261,6 +269,7 @@ class SitemapGenerator(object):
 
             if self.format == 'xml':
                 fd.write(XML_FOOTER)
+        timing.stop()
 
 
 def get_generators(generators):
@@ -7,13 +7,27 @@ A Pelican plugin to serialize generated HTML to JSON
 that can be used by jQuery plugin - Tipue Search.
 
 Copyright (c) Talha Mansoor
+
+The pages of ``TEMPLATE_PAGES`` are captured when the writer reports them
+written. The handler is connected when the generator is created, after the
+plugins that rewrite the pages on ``content_written`` (asset_bundler,
+critical_css, asset_fingerprint...), so the file read is the rewritten one.
+Only its ``<main>`` element is indexed (without scripts and forms), not the
+navigation, the footer or what these plugins add to the head. The file is
+hashed: pages that did not change since the last build reuse the node stored
+in ``CACHE_PATH/tipue_search.json`` instead of being parsed again.
+
+With ``TIPUE_SEARCH_SQLITE`` set to a file name, the same nodes are also
+written to a SQLite database in the output folder, in an FTS5 table ranked
+with bm25, for ``tools/search_server.py`` to answer queries server side.
 """
 
 from __future__ import unicode_literals
 
 import os.path
+import hashlib
+import itertools
 import json
-from bs4 import BeautifulSoup
 from codecs import open
 try:
     from urlparse import urljoin
@@ -21,6 +35,24 @@ except ImportError:
     from urllib.parse import urljoin
 
 from pelican import signals
+from pelican.plugins._utils import load_legacy_plugin
+
+metrics = load_legacy_plugin('build_metrics', [os.path.dirname(os.path.dirname(os.path.realpath(__file__)))])
+
+# Boilerplate that is not part of the text of a page
+IGNORED_TAGS = ('script', 'style', 'noscript', 'form', 'nav', 'footer')
+
+pages_indexed = metrics.counter('tipue_search_pages_total', 'Pages written to the search index')
+tpages_reused = metrics.counter('tipue_search_template_pages_reused_total',
+                                'Template pages taken from the cache instead of parsed')
+node_time = metrics.timer('tipue_search_node_seconds', 'Time to extract the text of a page')
+
+SQLITE_SCHEMA = """
+CREATE VIRTUAL TABLE pages USING fts5(
+    title, text, tags, url UNINDEXED,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
 
 
 class Tipue_Search_JSON_Generator(object):
@@ -34,6 +66,17 @@ class Tipue_Search_JSON_Generator(object):
         self.tpages = settings.get('TEMPLATE_PAGES')
         self.output_path = output_path
         self.json_nodes = []
+        self.sqlite_name = settings.get('TIPUE_SEARCH_SQLITE')
+        self.cache_path = os.path.join(settings.get('CACHE_PATH', 'cache'), 'tipue_search.json')
+        self.tpage_nodes = {}
+        self.cached_tpages = {}
+        if os.path.isfile(self.cache_path):
+            with open(self.cache_path, encoding='utf-8') as fd:
+                self.cached_tpages = json.load(fd)
+        self.tpage_paths = {os.path.normpath(os.path.join(output_path, save_as)): srclink
+                            for srclink, save_as in (self.tpages or {}).items()}
+        # Weak reference, disconnected with the generator at the end of the build
+        signals.content_written.connect(self.capture_tpage)
 
 
     def create_json_node(self, page):
@@ -41,6 +84,8 @@ class Tipue_Search_JSON_Generator(object):
         if getattr(page, 'status', 'published') != 'published':
             return
 
+        from bs4 import BeautifulSoup
+
         soup_title = BeautifulSoup(page.title.replace('&nbsp;', ' '), 'html.parser')
         page_title = soup_title.get_text(' ', strip=True).replace('“', '"').replace('”', '"').replace('’', "'").replace('^', '&#94;')
 
@@ -62,23 +107,75 @@ class Tipue_Search_JSON_Generator(object):
         self.json_nodes.append(node)
 
 
-    def create_tpage_node(self, srclink):
+    def capture_tpage(self, path, context):
+        srclink = self.tpage_paths.get(os.path.normpath(path))
+        if srclink is None:
+            return
+        with open(path, 'rb') as fd:
+            html = fd.read()
+        digest = hashlib.sha1(html).hexdigest()
+        cached = self.cached_tpages.get(srclink)
+        if cached is not None and cached['hash'] == digest:
+            self.tpage_nodes[srclink] = cached
+            tpages_reused.inc()
+        else:
+            self.tpage_nodes[srclink] = {'hash': digest, 'node': self.tpage_node(srclink, html.decode('utf-8'))}
 
-        srcfile = open(os.path.join(self.output_path, self.tpages[srclink]), encoding='utf-8')
-        soup = BeautifulSoup(srcfile, 'html.parser')
+
+    def tpage_node(self, srclink, html):
+
+        from bs4 import BeautifulSoup
+        soup = BeautifulSoup(html, 'html.parser')
         page_title = soup.title.string if soup.title is not None else ''
-        page_text = soup.get_text()
+        main = soup.find('main') or soup.body or soup
+        for tag in main.find_all(IGNORED_TAGS):
+            tag.decompose()
+        page_text = main.get_text(' ', strip=True).replace('“', '"').replace('”', '"').replace('’', "'").replace('^', '&#94;')
+        page_text = ' '.join(page_text.split())
 
         # Should set default category?
         page_category = ''
         page_url = urljoin(self.siteurl, self.tpages[srclink])
 
-        node = {'title': page_title,
+        return {'title': page_title,
                 'text': page_text,
                 'tags': page_category,
                 'url': page_url}
 
-        self.json_nodes.append(node)
+
+    def create_tpage_node(self, srclink):
+
+        if srclink not in self.tpage_nodes:
+            # Not written in this build, e.g. by the development server
+            cached = self.cached_tpages.get(srclink)
+            if cached is not None:
+                self.tpage_nodes[srclink] = cached
+            else:
+                srcfile = os.path.join(self.output_path, self.tpages[srclink])
+                if not os.path.isfile(srcfile):
+                    return
+                self.capture_tpage(srcfile, None)
+        self.json_nodes.append(self.tpage_nodes[srclink]['node'])
+
+
+    def open_database(self):
+        """ Creates the search database in a temporary file, replaced when complete."""
+        import sqlite3
+        path = os.path.join(self.output_path, self.sqlite_name + '.tmp')
+        if os.path.isfile(path):
+            os.remove(path)
+        database = sqlite3.connect(path)
+        database.execute(SQLITE_SCHEMA)
+        return database
+
+
+    def close_database(self, database):
+        # Merges the b-trees of the index, queries only read one
+        database.execute("INSERT INTO pages (pages) VALUES ('optimize')")
+        database.commit()
+        database.close()
+        path = os.path.join(self.output_path, self.sqlite_name)
+        os.replace(path + '.tmp', path)
 
 
     def generate_output(self, writer):
@@ -89,15 +186,35 @@ class Tipue_Search_JSON_Generator(object):
         for article in self.context['articles']:
             pages += article.translations
 
-        for srclink in self.tpages:
-            self.create_tpage_node(srclink)
-
-        for page in pages:
-            self.create_json_node(page)
-        root_node = {'pages': self.json_nodes}
+        nodes = itertools.chain(((self.create_tpage_node, srclink) for srclink in self.tpages),
+                                ((self.create_json_node, page) for page in pages))
 
+        database = self.open_database() if self.sqlite_name else None
         with open(path, 'w', encoding='utf-8') as fd:
-            json.dump(root_node, fd, separators=(',', ':'), ensure_ascii=False)
+            # Same output as dumping {'pages': [...]} at once, but written node
+            # by node so that the text of all the pages is never in memory
+            fd.write('{"pages":[')
+            separator = ''
+            for create_node, item in nodes:
+                with node_time.time():
+                    create_node(item)
+                pages_indexed.inc(len(self.json_nodes))
+                for node in self.json_nodes:
+                    fd.write(separator)
+                    json.dump(node, fd, separators=(',', ':'), ensure_ascii=False)
+                    separator = ','
+                    if database is not None:
+                        database.execute('INSERT INTO pages (title, text, tags, url) VALUES (?, ?, ?, ?)',
+                                         (node['title'], node['text'], node['tags'], node['url']))
+                self.json_nodes = []
+            fd.write(']}')
+        if database is not None:
+            self.close_database(database)
+
+        if not os.path.isdir(os.path.dirname(self.cache_path)):
+            os.makedirs(os.path.dirname(self.cache_path))
+        with open(self.cache_path, 'w', encoding='utf-8') as fd:
+            json.dump(self.tpage_nodes, fd, indent=1, ensure_ascii=False)
 
 
 def get_generators(generators):
@@ -12,6 +12,8 @@ TEMPLATE_PAGES = {'static_index.html': 'index.html',
                   'static_books.html': 'books/index.html',}
 
 STATIC_PATHS = ['images', 'static', 'pages']
+# The theme static files are copied by tools/sync_static.py, only when they change
+THEME_STATIC_PATHS = []
 
 ARTICLE_URL = 'blog/{slug}'
 ARTICLE_SAVE_AS = 'blog/{slug}/index.html'
@@ -37,7 +39,10 @@ SITEMAP = {
 
 FEED_DOMAIN = 'https://www.pythonforthelab.com'
 
-FEED_RSS = 'feed.rss'
+# feed.rss is written by plugins/incremental_feed.py, with the latest articles only
+FEED_RSS = None
+INCREMENTAL_FEED_SAVE_AS = 'feed.rss'
+INCREMENTAL_FEED_MAX_ITEMS = 20
 
 MARKUP = ('rst', 'markdown',)
 
@@ -46,7 +51,9 @@ RELATIVE_URLS = True
 INDEX_SAVE_AS = 'blog/index.html'
 
 PLUGIN_PATHS = ['plugins',]
-PLUGINS = ['new_pigment', 'header_image', 'tipue_search', 'sitemap', 'newsletter_directive']
+PLUGINS = ['build_metrics', 'new_pigment', 'header_image', 'tipue_search', 'sitemap', 'newsletter_directive',
+           'parallel_reader', 'asset_bundler', 'critical_css', 'asset_fingerprint', 'resource_hints', 'html_minify',
+           'latest_articles', 'incremental_feed', 'comments', 'related_articles', 'service_worker', 'low_memory']
 
 LOCALE = 'en_US.utf8'
 
@@ -58,3 +65,27 @@ FORCE_IMG_REBUILD = False
 DEFAULT_HEADER = 'static/img/compartments.jpg'
 
 DEFAULT_PAGINATION = 12
+
+# Fragment with the latest articles, see plugins/latest_articles.py
+LATEST_ARTICLES_COUNT = 6
+LATEST_ARTICLES_JSON = True
+LATEST_ARTICLES_INLINE = True
+
+# Local comment store (Staticman JSON files or a SQLite database), see plugins/comments.py
+COMMENTS_PATH = 'comments'
+
+# Number of related articles shown below each article
+RELATED_ARTICLES_COUNT = 5
+
+# search.html queries SEARCH_API_URL instead of downloading the index when it is set,
+# the index is then also written as a SQLite database, served by tools/search_server.py.
+SEARCH_API_URL = ''
+TIPUE_SEARCH_SQLITE = 'tipuesearch_content.sqlite' if SEARCH_API_URL else None
+
+# Precache the theme, the search index and the latest articles, see plugins/service_worker.py
+SERVICE_WORKER = False
+SERVICE_WORKER_ARTICLES = 10
+
+# Counters and timers of the plugins, logged at the end of the build, see plugins/build_metrics.py
+METRICS = False
+METRICS_PROMETHEUS = None
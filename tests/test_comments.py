@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+""" Builds the comment fragments from small stores, without network access."""
+
+import json
+import os
+import sqlite3
+import sys
+from types import SimpleNamespace
+
+from pelican.settings import read_settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(os.path.join(ROOT, 'plugins'))
+
+import comments  # noqa: E402
+
+COMMENTS = [
+    {'url': '/blog/first-article/', 'name': 'Ada', 'website': 'https://example.org',
+     'message': 'Second comment', 'date': 1577962800000},
+    {'url': 'blog/first-article', 'name': 'Bob', 'website': 'javascript:alert(1)',
+     'message': 'First <b>comment</b>', 'date': '2020-01-01T10:00:00'},
+]
+
+
+def json_store(tmp_path):
+    store = tmp_path / 'store'
+    store.mkdir()
+    (store / 'one.json').write_text(json.dumps(COMMENTS[0]), encoding='utf-8')
+    # A file can also hold a list of comments
+    (store / 'two.json').write_text(json.dumps(COMMENTS[1:]), encoding='utf-8')
+    return str(store)
+
+
+def sqlite_store(tmp_path):
+    store = str(tmp_path / 'comments.sqlite')
+    connection = sqlite3.connect(store)
+    connection.execute('CREATE TABLE comments (url, name, website, message, date)')
+    connection.executemany('INSERT INTO comments VALUES (:url, :name, :website, :message, :date)', COMMENTS)
+    connection.commit()
+    connection.close()
+    return store
+
+
+def build(tmp_path, store, overrides=(), urls=('blog/first-article/', 'blog/second-article/')):
+    settings = read_settings(override={
+        'COMMENTS_PATH': store,
+        'CACHE_PATH': str(tmp_path / 'cache'),
+        'THEME_TEMPLATES_OVERRIDES': list(overrides),
+    })
+    articles = [SimpleNamespace(url=url, translations=[]) for url in urls]
+    output = str(tmp_path / 'output')
+    generator = comments.CommentsGenerator({'articles': articles}, settings, str(tmp_path),
+                                           os.path.join(ROOT, 'theme'), output)
+    generator.generate_context()
+    generator.generate_output(None)
+    return os.path.join(output, 'comments', 'blog', 'first-article', 'comments.html'), \
+        os.path.join(output, 'comments', 'blog', 'second-article', 'comments.html')
+
+
+def check_fragments(tmp_path, store):
+    with_comments, without_comments = build(tmp_path, store)
+    with open(with_comments, encoding='utf-8') as f:
+        html = f.read()
+    assert '2 comments' in html
+    # Sorted by date, escaped, and only plain links kept
+    assert html.index('Bob') < html.index('Ada')
+    assert 'First &lt;b&gt;comment&lt;/b&gt;' in html
+    assert 'href="https://example.org"' in html
+    assert 'javascript:' not in html
+    with open(without_comments, encoding='utf-8') as f:
+        assert f.read() == comments.EMPTY_FRAGMENT
+
+
+def test_json_store(tmp_path):
+    check_fragments(tmp_path, json_store(tmp_path))
+
+
+def test_sqlite_store(tmp_path):
+    check_fragments(tmp_path, sqlite_store(tmp_path))
+
+
+def test_unchanged_fragments_are_kept(tmp_path):
+    store = json_store(tmp_path)
+    with_comments, _ = build(tmp_path, store)
+    with open(with_comments, 'w', encoding='utf-8') as f:
+        f.write('kept')
+    build(tmp_path, store)
+    with open(with_comments, encoding='utf-8') as f:
+        assert f.read() == 'kept'
+
+
+def test_template_change_renders_again(tmp_path):
+    store = json_store(tmp_path)
+    with_comments, _ = build(tmp_path, store)
+    overrides = tmp_path / 'templates'
+    overrides.mkdir()
+    (overrides / 'comment_list.html').write_text(
+        '{% for comment in comments %}<p>{{ comment.name }}</p>{% endfor %}', encoding='utf-8')
+    build(tmp_path, store, [str(overrides)])
+    with open(with_comments, encoding='utf-8') as f:
+        assert f.read() == '<p>Bob</p><p>Ada</p>'
+
+
+def test_fragments_of_removed_articles_are_deleted(tmp_path):
+    store = json_store(tmp_path)
+    with_comments, without_comments = build(tmp_path, store)
+    build(tmp_path, store, urls=['blog/first-article/'])
+    assert os.path.isfile(with_comments)
+    assert not os.path.exists(os.path.dirname(without_comments))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+""" Deploys a small output folder to a local folder, and checks the commands of the sftp transport."""
+
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools.deploy import REMOTE_MANIFEST, LocalTransport, SFTPTransport, deploy  # noqa: E402
+
+
+def make_output(tmp_path):
+    output = tmp_path / 'output'
+    (output / 'theme').mkdir(parents=True)
+    (output / 'index.html').write_text('<html>home</html>', encoding='utf-8')
+    (output / 'theme' / 'site.css').write_text('body {}', encoding='utf-8')
+    (output / 'old.html').write_text('<html>old</html>', encoding='utf-8')
+    return output
+
+
+def run(tmp_path, output, target, **kwargs):
+    return deploy(str(output), LocalTransport(str(target)),
+                  stat_cache_path=str(tmp_path / 'stat_cache.json'), **kwargs)
+
+
+def test_only_the_difference_is_sent(tmp_path):
+    output = make_output(tmp_path)
+    target = tmp_path / 'site'
+    result = run(tmp_path, output, target)
+    # Assets first, pages last
+    assert result['uploaded'] == ['theme/site.css', 'index.html', 'old.html']
+    assert (target / 'theme' / 'site.css').read_text(encoding='utf-8') == 'body {}'
+
+    (output / 'index.html').write_text('<html>new home</html>', encoding='utf-8')
+    os.remove(str(output / 'old.html'))
+    result = run(tmp_path, output, target)
+    assert result['uploaded'] == ['index.html']
+    assert result['deleted'] == ['old.html']
+    assert result['unchanged'] == 1
+    assert (target / 'index.html').read_text(encoding='utf-8') == '<html>new home</html>'
+    assert not (target / 'old.html').exists()
+    deployed = json.loads((target / REMOTE_MANIFEST).read_text(encoding='utf-8'))
+    assert sorted(deployed) == ['index.html', 'theme/site.css']
+
+
+def test_dry_run_changes_nothing(tmp_path):
+    output = make_output(tmp_path)
+    target = tmp_path / 'site'
+    result = run(tmp_path, output, target, dry_run=True)
+    assert sorted(result['uploaded']) == ['index.html', 'old.html', 'theme/site.css']
+    assert not target.exists()
+
+
+class RecordingConnection(object):
+    """ Stands for a fabric connection, keeps the commands instead of running them."""
+
+    def __init__(self):
+        self.commands = []
+        self.puts = []
+
+    def run(self, command, hide=False):
+        self.commands.append(command)
+
+    def put(self, local, remote):
+        self.puts.append(remote)
+
+
+def test_sftp_paths_are_quoted(tmp_path):
+    local_file = tmp_path / 'page.html'
+    local_file.write_text('<html></html>', encoding='utf-8')
+    transport = SFTPTransport('example.org', "/var/www/my site")
+    connection = transport.local.connection = RecordingConnection()
+
+    transport.upload(str(local_file), "blog/it's here.html")
+    transport.delete('blog/a; rm -rf ~.html')
+    assert connection.commands == [
+        "mkdir -p '/var/www/my site/blog'",
+        "mv -f '/var/www/my site/blog/it'\"'\"'s here.html.deploy' '/var/www/my site/blog/it'\"'\"'s here.html'",
+        "rm -f '/var/www/my site/blog/a; rm -rf ~.html'",
+    ]
+    assert connection.puts == ["/var/www/my site/blog/it's here.html.deploy"]
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+""" Resolves the internal links of a small output folder."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools.link_checker import check_internal, html_files, parse_page  # noqa: E402
+
+SITE_URL = 'https://www.example.org'
+
+PAGES = {
+    'index.html': '''<a href="blog/first/">first</a>
+<a href="/blog/first/#intro">intro</a>
+<a href="https://www.example.org/blog/first">absolute</a>
+<a href="blog/first/#top">top</a>
+<a href="blog/missing/">missing</a>
+<a href="blog/first/#nowhere">bad anchor</a>
+<img src="theme/logo%20big.png">
+<a href="https://python.org/">external</a>
+<a href="mailto:me@example.org">mail</a>''',
+    'blog/first/index.html': '''<h2 id="intro">Intro</h2>
+<a href="../../index.html">home</a>
+<a href="../second.html">sibling</a>''',
+}
+
+
+def test_internal_links(tmp_path):
+    for path, html in PAGES.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(html, encoding='utf-8')
+    (tmp_path / 'theme').mkdir()
+    (tmp_path / 'theme' / 'logo big.png').write_bytes(b'png')
+
+    pages = {}
+    for path in html_files(str(tmp_path)):
+        path, links, ids = parse_page(str(tmp_path), path)
+        pages[path] = (links, ids)
+    broken, external = check_internal(str(tmp_path), pages, SITE_URL)
+
+    assert sorted((page, url, reason) for page, line, url, reason in broken) == [
+        ('blog/first/index.html', '../second.html', 'missing file'),
+        ('index.html', 'blog/first/#nowhere', 'missing anchor'),
+        ('index.html', 'blog/missing/', 'missing file'),
+    ]
+    assert list(external) == ['https://python.org/']
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+""" Builds a small site with the rst files parsed in a pool, then from the reader cache."""
+
+import os
+import sys
+
+from pelican import Pelican
+from pelican.settings import read_settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+ARTICLE = '''Article {0}
+##########
+
+:date: 2020-01-{0:02d} 10:00
+:tags: python, test{0}
+:summary: Summary of article {0}
+
+Some *text* of article {0}.
+
+.. code-block:: python
+
+    print({0})
+'''
+
+
+def make_content(tmp_path, count=8):
+    content = tmp_path / 'content'
+    content.mkdir()
+    for number in range(1, count + 1):
+        (content / 'article_{}.rst'.format(number)).write_text(ARTICLE.format(number), encoding='utf-8')
+    return str(content)
+
+
+def build(tmp_path, content, name, **overrides):
+    output = str(tmp_path / name)
+    settings = read_settings(override=dict({
+        'PATH': content,
+        'OUTPUT_PATH': output,
+        'CACHE_PATH': str(tmp_path / 'cache'),
+        'PLUGIN_PATHS': [os.path.join(ROOT, 'plugins')],
+        'PLUGINS': ['parallel_reader'],
+        'TIMEZONE': 'UTC',
+        'SITEURL': '',
+        'FEED_ALL_ATOM': None,
+        'CATEGORY_FEED_ATOM': None,
+    }, **overrides))
+    Pelican(settings).run()
+    pages = {}
+    for number in range(1, 9):
+        with open(os.path.join(output, 'article-{}.html'.format(number)), encoding='utf-8') as f:
+            pages[number] = f.read()
+    return pages
+
+
+def test_pool_and_cache_give_the_same_pages(tmp_path, monkeypatch):
+    content = make_content(tmp_path)
+    serial = build(tmp_path, content, 'serial', PARALLEL_READER_PROCESSES=1, READER_CACHE=False)
+    assert 'Some <em>text</em> of article 3.' in serial[3]
+    assert build(tmp_path, content, 'pool', PARALLEL_READER_PROCESSES=2) == serial
+
+    # Every document is in the cache now, docutils must not be reached. Without
+    # workers, what is not in the cache goes through read_raw
+    def no_parsing(*args):
+        raise AssertionError('parsed again')
+    monkeypatch.setattr(sys.modules['parallel_reader'], 'read_raw', no_parsing)
+    assert build(tmp_path, content, 'cached', PARALLEL_READER_PROCESSES=1) == serial
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+""" Syncs small static folders into a temporary output."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT)
+
+from tools.sync_static import sync  # noqa: E402
+
+
+def make_sources(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'img').mkdir(parents=True)
+    (static / 'img' / 'logo.png').write_bytes(b'logo')
+    (static / 'robots.txt').write_text('User-agent: *', encoding='utf-8')
+    return [(str(static), 'static')]
+
+
+def test_only_changed_files_are_copied(tmp_path):
+    folders = make_sources(tmp_path)
+    output = tmp_path / 'output'
+    manifest = str(tmp_path / 'manifest.json')
+    copied, deleted = sync(str(output), folders, manifest)
+    assert sorted(copied) == ['static/img/logo.png', 'static/robots.txt']
+    assert (output / 'static' / 'img' / 'logo.png').read_bytes() == b'logo'
+
+    (tmp_path / 'static' / 'robots.txt').write_text('User-agent: bot', encoding='utf-8')
+    copied, deleted = sync(str(output), folders, manifest)
+    assert copied == ['static/robots.txt']
+    assert deleted == []
+
+
+def test_removed_sources_are_deleted_from_the_output(tmp_path):
+    folders = make_sources(tmp_path)
+    output = tmp_path / 'output'
+    manifest = str(tmp_path / 'manifest.json')
+    sync(str(output), folders, manifest)
+    # Written by Pelican, never synced, so it must stay
+    (output / 'index.html').write_text('<html></html>', encoding='utf-8')
+
+    os.remove(str(tmp_path / 'static' / 'img' / 'logo.png'))
+    copied, deleted = sync(str(output), folders, manifest)
+    assert copied == []
+    assert deleted == ['static/img/logo.png']
+    assert not (output / 'static' / 'img' / 'logo.png').exists()
+    assert (output / 'static' / 'robots.txt').exists()
+    assert (output / 'index.html').exists()
@@ -1,12 +1,14 @@
 $(document).ready(function () {
+    var container = $('#current-comments');
     $.ajax({
         type: 'GET',
-        url: '/comments/{{ article.url }}comments.html',
+        // Every article has a pre-rendered fragment, even when it has no comments
+        url: container.data('src'),
         success: function (data) {
-            $('#current-comments').html(data);
+            container.html(data);
         },
         error: function () {
-            $('#current-comments').html('<h3 class="mb-3">No comments yet, be the first!</h3>');
+            container.html('<h3 class="mb-3">No comments yet, be the first!</h3>');
         }
     });
-});
\ No newline at end of file
+});
@@ -1,11 +1,16 @@
 $(document).ready(function () {
+    // The URL of the hashed fragment written by the latest_articles plugin
+    var container = $("#latest_articles");
+    if (!container.data("src")) {
+        return;
+    }
     $.ajax({
         dataType: "html",
-        url: '/latest_articles.html',
+        url: container.data("src"),
         success: function(data) {
-            $("#latest_articles").fadeOut(function () {
+            container.fadeOut(function () {
                 $(this).html(data).slideDown();
             });
         }
     });
-});
\ No newline at end of file
+});
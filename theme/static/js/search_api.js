@@ -0,0 +1,36 @@
+$(document).ready(function () {
+    var container = $("#tipue_search_content");
+    var query = new URLSearchParams(window.location.search).get("q") || "";
+    $("#tipue_search_input").val(query);
+    if (!query.trim()) {
+        return;
+    }
+
+    function escapeHtml(text) {
+        return $("<div>").text(text).html();
+    }
+
+    $.ajax({
+        dataType: "json",
+        url: container.data("api"),
+        data: {q: query, limit: 20},
+        success: function (data) {
+            if (!data.results.length) {
+                container.html('<div id="tipue_search_warning">Nothing found.</div>');
+                return;
+            }
+            var out = '<div id="tipue_search_results_count">' + data.results.length + ' results</div>';
+            $.each(data.results, function (i, result) {
+                var url = escapeHtml(result.url);
+                out += '<div class="tipue_search_content_title"><a href="' + url + '">' + escapeHtml(result.title) + '</a></div>';
+                out += '<div class="tipue_search_content_url"><a href="' + url + '">' + url + '</a></div>';
+                // The snippet is escaped by the server, only <b> marks the matches
+                out += '<div class="tipue_search_content_text">' + result.snippet + '</div>';
+            });
+            container.html(out);
+        },
+        error: function () {
+            container.html('<div id="tipue_search_warning">The search is not available right now.</div>');
+        }
+    });
+});
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+Command line helpers used by the Makefile to build, serve and publish the
+website. Run them from the root of the repository, e.g.
+``python -m tools.serve``.
+"""
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Build worker
+============
+
+Parses reStructuredText sources for the builds of other machines, see
+``PARALLEL_READER_WORKERS`` in ``plugins/parallel_reader.py``. The worker
+loads the same settings and plugins as a build and waits for coordinators to
+connect::
+
+    python -m tools.build_worker [--settings settings.py] [--path content] [--port 9100]
+
+Every connection is served by its own process, so a coordinator can list the
+same worker several times to use several of its CPUs::
+
+    PARALLEL_READER_WORKERS = ['builder:9100', 'builder:9100']
+
+The worker needs a checkout of the site at the same revision as the
+coordinator: files are read from its own copy, and only parsed if their hash
+is the one the coordinator sent. Parsed documents are kept in the reader cache
+of the worker, so a shard seen before is answered without parsing it again.
+
+The protocol is not authenticated, only listen on a trusted network.
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import os
+import socketserver
+import sys
+
+from pelican.plugins._utils import load_plugins
+from pelican.readers import Readers
+from pelican.settings import read_settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Imported under the name Pelican loads it with, so that the plugins find the
+# same module in sys.modules instead of loading a second copy
+sys.path.append(os.path.join(ROOT, 'plugins'))
+from parallel_reader import ReaderCache, parser_hash, raw_metadata, serve_connection  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def make_reader(settings):
+    """ Returns the rst reader of a build with settings, plugins registered."""
+    for plugin in load_plugins(settings):
+        plugin.register()
+    reader = Readers(settings).readers['rst']
+    reader.process_metadata = raw_metadata
+    return reader
+
+
+class ForkingTCPServer(socketserver.ForkingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def serve(reader, host='0.0.0.0', port=9100):
+    """ Returns a server handing every connection to serve_connection, call serve_forever to start it."""
+    cache = ReaderCache(reader.settings, reader)
+
+    class Handler(socketserver.BaseRequestHandler):
+
+        def handle(self):
+            logger.info('Coordinator connected from {}:{}'.format(*self.client_address))
+            try:
+                serve_connection(self.request, reader, reader.settings['PATH'], cache)
+            except OSError as e:
+                logger.warning('Connection with {}:{} lost: {}'.format(*self.client_address, e))
+
+    return ForkingTCPServer((host, port), Handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse the sources of remote builds.')
+    parser.add_argument('--settings', '-s', default=os.path.join(ROOT, 'settings.py'))
+    parser.add_argument('--path', default=os.path.join(ROOT, 'content'), help='content folder')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    settings = read_settings(args.settings, override={'PATH': os.path.abspath(args.path)})
+    reader = make_reader(settings)
+    server = serve(reader, args.host, args.port)
+    logger.info('Build worker for {} listening on {}:{}, parser {}'.format(
+        settings['PATH'], args.host, server.server_address[1], parser_hash(reader)[:8]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Deploy
+======
+
+Publishes the output folder by sending only what changed since the last
+deploy. The target keeps a manifest of what was deployed to it,
+``.deploy-manifest.json`` (see ``tools/manifest.py``), which is diffed
+against a manifest of the output folder to find out the files to upload and
+the ones to delete::
+
+    python -m tools.deploy output/ sftp://user@host/var/www/site [--jobs 8] [--dry-run]
+    python -m tools.deploy output/ /tmp/site-copy
+
+Uploads run in parallel, ``--jobs`` at a time. Assets go first and pages
+last, so a page never references a file that is not on the server yet.
+Files are only deleted once every upload succeeded, and the manifest only
+records the files that did arrive, so a failed deploy is safe to run again and
+only sends what is still missing.
+
+Targets are handled by transports, chosen by the scheme of the target:
+
+* a path or ``file://``: a local folder, to try a deploy offline
+* ``sftp://``: a server reached over SSH with fabric, as in
+  ``example_code/28_fabric``
+
+A transport implements ``upload``, ``delete``, ``read`` and ``write``. Add a
+new one to ``TRANSPORTS`` to support another kind of target.
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import io
+import json
+import logging
+import os
+import posixpath
+import shlex
+import shutil
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from tools.manifest import build_manifest, diff_manifests, load_manifest, save_manifest
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+REMOTE_MANIFEST = '.deploy-manifest.json'
+STAT_CACHE_PATH = os.path.join(ROOT, 'cache', 'deploy_stat_cache.json')
+# Uploaded after everything else, they reference the other files
+LAST_EXTENSIONS = ('.html', '.xml')
+
+
+class LocalTransport(object):
+    """ Deploys to a folder of this machine."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def upload(self, local_path, path):
+        target = os.path.join(self.path, *path.split('/'))
+        folder = os.path.dirname(target)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        shutil.copyfile(local_path, target + '.deploy')
+        os.replace(target + '.deploy', target)
+
+    def delete(self, path):
+        target = os.path.join(self.path, *path.split('/'))
+        if os.path.isfile(target):
+            os.remove(target)
+
+    def read(self, path):
+        target = os.path.join(self.path, path)
+        if not os.path.isfile(target):
+            return None
+        with open(target, 'rb') as f:
+            return f.read()
+
+    def write(self, path, data):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        target = os.path.join(self.path, path)
+        with open(target + '.deploy', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.deploy', target)
+
+    def close(self):
+        pass
+
+
+class SFTPTransport(object):
+    """ Deploys to a folder of a server, over SSH. Every thread opens its own connection."""
+
+    def __init__(self, host, path, user=None, port=None):
+        self.host = host
+        self.path = path
+        self.user = user
+        self.port = port
+        self.local = threading.local()
+        self.connections = []
+        self.folders = set()
+        self.lock = threading.Lock()
+
+    def connection(self):
+        if getattr(self.local, 'connection', None) is None:
+            from fabric import Connection
+
+            self.local.connection = Connection(self.host, user=self.user, port=self.port)
+            with self.lock:
+                self.connections.append(self.local.connection)
+        return self.local.connection
+
+    def remote(self, path):
+        return posixpath.join(self.path, path)
+
+    def upload(self, local_path, path):
+        connection = self.connection()
+        folder = posixpath.dirname(self.remote(path))
+        with self.lock:
+            known = folder in self.folders
+            self.folders.add(folder)
+        if not known:
+            connection.run('mkdir -p {}'.format(shlex.quote(folder)), hide=True)
+        connection.put(local_path, remote=self.remote(path) + '.deploy')
+        connection.run('mv -f {} {}'.format(
+            shlex.quote(self.remote(path) + '.deploy'), shlex.quote(self.remote(path))), hide=True)
+
+    def delete(self, path):
+        self.connection().run('rm -f {}'.format(shlex.quote(self.remote(path))), hide=True)
+
+    def read(self, path):
+        buffer = io.BytesIO()
+        try:
+            self.connection().get(self.remote(path), local=buffer)
+        except IOError:
+            return None
+        return buffer.getvalue()
+
+    def write(self, path, data):
+        self.connection().run('mkdir -p {}'.format(shlex.quote(self.path)), hide=True)
+        self.connection().put(io.BytesIO(data), remote=self.remote(path))
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+
+def local_transport(url):
+    return LocalTransport(url.path)
+
+
+def sftp_transport(url):
+    try:
+        import fabric  # noqa: F401
+    except ImportError:
+        raise ValueError('The sftp transport needs fabric, install it with pip install fabric')
+    return SFTPTransport(url.hostname, url.path, url.username, url.port)
+
+
+# {scheme: factory taking the parsed target}
+TRANSPORTS = {
+    '': local_transport,
+    'file': local_transport,
+    'sftp': sftp_transport,
+}
+
+
+def get_transport(target):
+    url = urlparse(target)
+    if url.scheme not in TRANSPORTS:
+        raise ValueError('No transport for {}, known schemes: {}'.format(
+            target, ', '.join(s for s in TRANSPORTS if s)))
+    return TRANSPORTS[url.scheme](url)
+
+
+def upload_order(path):
+    return (path.endswith(LAST_EXTENSIONS), path)
+
+
+def deploy(output_path, transport, jobs=8, dry_run=False, stat_cache_path=STAT_CACHE_PATH):
+    """ Uploads the files of output_path that differ from the deployed ones and deletes the gone ones.
+
+    :returns: dict with the uploaded and deleted paths, the bytes uploaded and the failed uploads
+    """
+    stat_caches = load_manifest(stat_cache_path)
+    stat_cache = stat_caches.setdefault(os.path.realpath(output_path), {})
+    manifest = build_manifest(output_path, stat_cache)
+    save_manifest(stat_caches, stat_cache_path)
+
+    data = transport.read(REMOTE_MANIFEST)
+    deployed = json.loads(data.decode('utf-8')) if data else {}
+    changed, removed = diff_manifests(deployed, manifest)
+    changed.sort(key=upload_order)
+    size = sum(os.path.getsize(os.path.join(output_path, path)) for path in changed)
+    result = {'uploaded': [], 'deleted': [], 'bytes': size, 'failed': [], 'unchanged': len(manifest) - len(changed)}
+    if dry_run:
+        result.update(uploaded=changed, deleted=removed)
+        return result
+
+    def upload(path):
+        transport.upload(os.path.join(output_path, path), path)
+        return path
+
+    # Pages wait for the assets they reference
+    first = [path for path in changed if not path.endswith(LAST_EXTENSIONS)]
+    last = [path for path in changed if path.endswith(LAST_EXTENSIONS)]
+    with ThreadPoolExecutor(jobs) as executor:
+        for group in (first, last):
+            if result['failed']:
+                break
+            futures = [(path, executor.submit(upload, path)) for path in group]
+            for path, future in futures:
+                try:
+                    future.result()
+                    deployed[path] = manifest[path]
+                    result['uploaded'].append(path)
+                except Exception as e:
+                    logger.error('Could not upload {}: {}'.format(path, e))
+                    result['failed'].append(path)
+
+    if not result['failed']:
+        for path in removed:
+            transport.delete(path)
+            deployed.pop(path, None)
+            result['deleted'].append(path)
+    else:
+        result['bytes'] = sum(os.path.getsize(os.path.join(output_path, path)) for path in result['uploaded'])
+    # Written even after a failure, the next deploy skips what did arrive
+    transport.write(REMOTE_MANIFEST, json.dumps(deployed, indent=1, sort_keys=True).encode('utf-8'))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish the files of the output folder that changed.')
+    parser.add_argument('output', nargs='?', default=os.path.join(ROOT, 'output'))
+    parser.add_argument('target', help='folder, file:// or sftp://user@host/path to deploy to')
+    parser.add_argument('--jobs', '-j', type=int, default=8, help='number of parallel uploads')
+    parser.add_argument('--dry-run', '-n', action='store_true', help='only list what would change')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        transport = get_transport(args.target)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        result = deploy(args.output, transport, max(1, args.jobs), args.dry_run)
+    finally:
+        transport.close()
+    if args.dry_run:
+        for path in result['uploaded']:
+            print('upload {}'.format(path))
+        for path in result['deleted']:
+            print('delete {}'.format(path))
+    logger.info('Deploy{}: {} uploaded ({:.1f} kB), {} deleted, {} unchanged, {} failed'.format(
+        ' (dry run)' if args.dry_run else '', len(result['uploaded']), result['bytes'] / 1024,
+        len(result['deleted']), result['unchanged'], len(result['failed'])))
+    if result['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
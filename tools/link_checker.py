@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Link checker
+============
+
+Checks the links and assets of the generated website, without a server.
+
+Every HTML file in the output folder is parsed with the streaming
+``html.parser`` in a pool of processes. Internal links (relative, root
+relative or starting with ``SITEURL``) are resolved against the file tree,
+following the same rules as the web server (``blog/slug`` is served from
+``blog/slug/index.html``), and ``#fragments`` are checked against the ids of
+the target page. No network access is needed for this.
+
+With ``--external``, links to other websites are checked as well, with
+``HEAD`` requests (falling back to ``GET``) run from asyncio, limiting the
+number of concurrent requests per host. Results are kept in
+``cache/link_checker.json`` and reused until they are older than ``--ttl``
+seconds.
+
+    python -m tools.link_checker [output] [--external] [--ttl 86400]
+
+The exit code is 1 if any internal link is broken.
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, unquote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+CACHE_PATH = os.path.join(ROOT, 'cache', 'link_checker.json')
+
+LINK_ATTRIBUTES = {
+    'a': 'href',
+    'link': 'href',
+    'script': 'src',
+    'img': 'src',
+    'iframe': 'src',
+    'source': 'src',
+    'video': 'src',
+    'audio': 'src',
+    'form': 'action',
+}
+IGNORED_SCHEMES = ('mailto:', 'tel:', 'javascript:', 'data:')
+USER_AGENT = 'pftl-link-checker'
+
+
+class LinkParser(HTMLParser):
+    """ Collects the links and the ids of a page while it is being fed."""
+
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.links = []
+        self.ids = set()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if attrs.get('id'):
+            self.ids.add(attrs['id'])
+        if tag == 'a' and attrs.get('name'):
+            self.ids.add(attrs['name'])
+        if tag == 'link' and attrs.get('rel') in ('canonical', 'alternate'):
+            return
+        url = attrs.get(LINK_ATTRIBUTES.get(tag))
+        if url:
+            self.links.append((self.getpos()[0], url.strip()))
+        if attrs.get('srcset'):
+            for candidate in attrs['srcset'].split(','):
+                if candidate.strip():
+                    self.links.append((self.getpos()[0], candidate.split()[0]))
+
+    handle_startendtag = handle_starttag
+
+
+def parse_page(output_path, path):
+    """ Returns (path, links, ids) of an HTML file. Runs in the worker processes."""
+    parser = LinkParser()
+    with open(os.path.join(output_path, path), encoding='utf-8', errors='replace') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            parser.feed(chunk)
+    parser.close()
+    return path, parser.links, parser.ids
+
+
+def html_files(output_path):
+    for root, dirs, files in os.walk(output_path):
+        for name in files:
+            if name.endswith('.html'):
+                yield os.path.relpath(os.path.join(root, name), output_path).replace(os.sep, '/')
+
+
+def resolve_file(output_path, url_path):
+    """ Returns the file served for url_path, or None if it does not exist."""
+    relative = unquote(url_path).lstrip('/')
+    candidate = os.path.join(output_path, relative)
+    if relative and os.path.isfile(candidate):
+        return relative
+    index = os.path.join(relative, 'index.html') if relative else 'index.html'
+    if os.path.isfile(os.path.join(output_path, index)):
+        return index
+    return None
+
+
+def check_internal(output_path, pages, site_url):
+    """ Returns (broken internal links, external urls with the pages using them)."""
+    broken = []
+    external = {}
+    for page, (links, ids) in sorted(pages.items()):
+        page_url = '/' + page
+        for line, url in links:
+            if url.startswith(IGNORED_SCHEMES):
+                continue
+            if site_url and url.startswith(site_url):
+                url = url[len(site_url):] or '/'
+            absolute = urljoin(page_url, url)
+            parts = urlsplit(absolute)
+            if parts.scheme or parts.netloc:
+                if parts.scheme in ('http', 'https', ''):
+                    external.setdefault(urljoin('https:', absolute).split('#')[0], []).append((page, line))
+                continue
+            target = resolve_file(output_path, parts.path) if parts.path else page
+            if target is None:
+                broken.append((page, line, url, 'missing file'))
+            # '#top' always scrolls to the top of the document, as per the HTML spec
+            elif (parts.fragment and parts.fragment != 'top' and target in pages and
+                  parts.fragment not in pages[target][1]):
+                broken.append((page, line, url, 'missing anchor'))
+    return broken, external
+
+
+def fetch_status(url, timeout):
+    """ Blocking request, run in a thread by the event loop."""
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+
+    for method in ('HEAD', 'GET'):
+        request = Request(url, method=method, headers={'User-Agent': USER_AGENT})
+        try:
+            with urlopen(request, timeout=timeout) as response:
+                return response.status
+        except HTTPError as e:
+            # Some servers do not implement HEAD
+            if method == 'HEAD' and e.code in (403, 405, 501):
+                continue
+            return e.code
+        except (URLError, OSError, ValueError) as e:
+            return str(getattr(e, 'reason', e))
+    return None
+
+
+async def check_external(urls, cache, ttl, per_host, total, timeout):
+    loop = asyncio.get_running_loop()
+    global_limit = asyncio.Semaphore(total)
+    host_limits = {}
+    now = time.time()
+
+    async def check(url):
+        cached = cache.get(url)
+        # Network errors are retried on every run, only HTTP answers are trusted
+        if cached and isinstance(cached[0], int) and now - cached[1] < ttl:
+            return
+        host = urlsplit(url).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        async with host_limit, global_limit:
+            status = await loop.run_in_executor(None, fetch_status, url, timeout)
+        cache[url] = [status, time.time()]
+
+    await asyncio.gather(*(check(url) for url in urls))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the links of the generated website.')
+    parser.add_argument('output', nargs='?', default=os.path.join(ROOT, 'output'))
+    parser.add_argument('--site-url', default='https://www.pythonforthelab.com',
+                        help='absolute links starting with it are checked as internal')
+    parser.add_argument('--external', action='store_true', help='check links to other websites')
+    parser.add_argument('--ttl', type=int, default=24 * 3600, help='seconds to trust a cached external result')
+    parser.add_argument('--per-host', type=int, default=2, help='concurrent requests per host')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent requests in total')
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args()
+
+    t0 = time.time()
+    files = list(html_files(args.output))
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(parse_page, [args.output] * len(files), files, chunksize=16)
+        pages = {path: (links, ids) for path, links, ids in results}
+    broken, external = check_internal(args.output, pages, args.site_url.rstrip('/'))
+    print('Checked {} links in {} pages in {:.2f} s'.format(
+        sum(len(links) for links, ids in pages.values()), len(pages), time.time() - t0))
+    for page, line, url, reason in broken:
+        print('{}:{}: {} ({})'.format(page, line, url, reason))
+
+    if args.external:
+        cache = {}
+        if os.path.isfile(CACHE_PATH):
+            with open(CACHE_PATH, encoding='utf-8') as f:
+                cache = json.load(f)
+        asyncio.run(check_external(
+            sorted(external), cache, args.ttl, args.per_host, args.concurrency, args.timeout))
+        if not os.path.isdir(os.path.dirname(CACHE_PATH)):
+            os.makedirs(os.path.dirname(CACHE_PATH))
+        with open(CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        failed = 0
+        for url in sorted(external):
+            status = cache[url][0]
+            if isinstance(status, int) and status < 400:
+                continue
+            failed += 1
+            page, line = external[url][0]
+            print('{}:{}: {} (external: {}, used in {} pages)'.format(page, line, url, status, len(external[url])))
+        print('Checked {} external links, {} failed'.format(len(external), failed))
+
+    print('{} broken internal links'.format(len(broken)))
+    return 1 if broken else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
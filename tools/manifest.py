@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Hash manifests
+==============
+
+Helpers to fingerprint a tree of files. A manifest is a plain dictionary
+``{relative path: sha1}`` stored as JSON, so it can be diffed against a
+previous one to find out which files are new, changed or gone.
+"""
+
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import os
+
+CHUNK_SIZE = 1 << 16
+
+
+def file_hash(path):
+    """ Returns the sha1 hex digest of the contents of a file."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def walk_files(folder):
+    """ Yields the paths of all the files in folder, relative to it, using '/' as separator."""
+    for root, dirs, files in os.walk(folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), folder)
+            yield path.replace(os.sep, '/')
+
+
+def build_manifest(folder, stat_cache=None):
+    """ Hashes every file in folder.
+
+    :param str folder: root of the tree to fingerprint
+    :param dict stat_cache: optional {path: [size, mtime, sha1]} from a previous
+        run. Files whose size and mtime did not change are not read again. It is
+        updated in place.
+    """
+    manifest = {}
+    for path in walk_files(folder):
+        full_path = os.path.join(folder, path)
+        st = os.stat(full_path)
+        cached = stat_cache.get(path) if stat_cache is not None else None
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+            manifest[path] = cached[2]
+            continue
+        manifest[path] = file_hash(full_path)
+        if stat_cache is not None:
+            stat_cache[path] = [st.st_size, st.st_mtime, manifest[path]]
+    if stat_cache is not None:
+        for path in set(stat_cache) - set(manifest):
+            del stat_cache[path]
+    return manifest
+
+
+def diff_manifests(old, new):
+    """ Returns the sorted lists (changed, removed) of paths going from old to new."""
+    changed = sorted(path for path, sha in new.items() if old.get(path) != sha)
+    removed = sorted(path for path in old if path not in new)
+    return changed, removed
+
+
+def load_manifest(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+
+def save_manifest(manifest, path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
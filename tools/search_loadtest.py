@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Search load test
+================
+
+Sends queries to the search service at increasing levels of concurrency and
+reports the latency percentiles of each level.
+
+Without ``--url``, the service of ``tools/search_server.py`` is started in
+this process, on a free port, over the given database, and its result cache
+is emptied before every level so that they all start cold. Queries are made
+of one or two words taken from the titles of the indexed pages, drawn with a
+fixed seed, so two runs send the same queries.
+
+    python -m tools.search_loadtest [database] [--concurrency 1 4 16 64] [--requests 500]
+    python -m tools.search_loadtest --url http://127.0.0.1:8001/search
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from urllib.request import urlopen
+
+from tools.search_server import SearchIndex, serve
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+def sample_queries(database, count, seed=0):
+    """ Returns count queries of one or two words from the titles of database."""
+    connection = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(database)), uri=True)
+    try:
+        titles = [row[0] for row in connection.execute('SELECT title FROM pages')]
+    finally:
+        connection.close()
+    words = sorted({w for title in titles for w in re.findall(r'\w{4,}', title.lower())})
+    if not words:
+        raise ValueError('{} has no pages to take queries from'.format(database))
+    generator = random.Random(seed)
+    return [' '.join(generator.sample(words, min(len(words), generator.choice((1, 2))))) for _ in range(count)]
+
+
+def timed_request(url):
+    """ Returns (seconds, error or None) of a request."""
+    start = time.perf_counter()
+    try:
+        with urlopen(url, timeout=30) as response:
+            response.read()
+        return time.perf_counter() - start, None
+    except Exception as e:
+        return time.perf_counter() - start, e
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_level(url, queries, concurrency):
+    urls = ['{}?q={}'.format(url, quote(q)) for q in queries]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed_request, urls))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(seconds for seconds, error in results)
+    errors = sum(1 for seconds, error in results if error is not None)
+    return {
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'throughput': len(results) / elapsed,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the latency of the search service.')
+    parser.add_argument('database', nargs='?', default=os.path.join(ROOT, 'output', 'tipuesearch_content.sqlite'))
+    parser.add_argument('--url', help='search endpoint to test, instead of a local server')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=500, help='requests per concurrency level')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    queries = sample_queries(args.database, args.requests, args.seed)
+    index = server = None
+    url = args.url
+    if url is None:
+        index = SearchIndex(args.database)
+        server = serve(index, port=0, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}/search'.format(server.server_port)
+
+    print('{:>11} {:>9} {:>9} {:>10} {:>7} {:>9}'.format(
+        'concurrency', 'p50 ms', 'p99 ms', 'req/s', 'errors', 'cache hit'))
+    try:
+        for concurrency in args.concurrency:
+            if index is not None:
+                index.clear()
+            result = run_level(url, queries, concurrency)
+            hit_rate = '{:.0%}'.format(index.hits / (index.hits + index.misses)) if index and index.misses else '-'
+            print('{:>11} {:>9.2f} {:>9.2f} {:>10.0f} {:>7} {:>9}'.format(
+                concurrency, result['p50'] * 1000, result['p99'] * 1000, result['throughput'],
+                result['errors'], hit_rate))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Search server
+=============
+
+Answers the queries of the search page from the SQLite database written by
+the tipue_search plugin (``TIPUE_SEARCH_SQLITE``), so browsers do not have to
+download the text of the whole site to search it.
+
+The service is a plain WSGI application, ``make_app``, that can be mounted in
+any WSGI server. Run as a module, it is served by a threaded ``wsgiref``
+server, which is enough as a local stand-in::
+
+    python -m tools.search_server [output/tipuesearch_content.sqlite] [--port 8001]
+
+    GET /search?q=python+lab&limit=10
+    {"query": "python lab", "results": [{"title": ..., "url": ..., "tags": ...,
+     "snippet": "... <b>Python</b> for the <b>Lab</b> ..."}]}
+
+Pages are ranked with bm25, matches in the title count more than in the tags,
+and those more than in the text. Every thread keeps its own read-only
+connection, whose prepared statements are reused from query to query
+(``cached_statements``). Results are kept in an LRU cache shared by all the
+threads, keyed by the query and by the modification time of the database, so
+a new build of the site is picked up without restarting the service.
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import html
+import json
+import os
+import re
+import threading
+
+from collections import OrderedDict
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Column weights of bm25: title, text, tags (url is not indexed)
+SEARCH_SQL = """
+SELECT title, url, tags, snippet(pages, 1, char(2), char(3), '...', 24)
+FROM pages
+WHERE pages MATCH ?
+ORDER BY bm25(pages, 10.0, 1.0, 5.0)
+LIMIT ?
+"""
+MAX_TERMS = 8
+MAX_LIMIT = 50
+
+_term_re = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(query):
+    """ Turns what the user typed into an FTS5 query, the last word being a prefix.
+
+    Every word is quoted, so characters with a meaning for FTS5 (quotes, ``*``,
+    ``-``, ``NEAR``...) can not produce a syntax error.
+    """
+    terms = _term_re.findall(query.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join('"{}"'.format(t) for t in terms) + '*'
+
+
+def highlight(snippet):
+    """ Escapes a snippet and marks the matches, delimited by \\x02 and \\x03, in bold."""
+    return html.escape(snippet).replace('\x02', '<b>').replace('\x03', '</b>')
+
+
+class SearchIndex(object):
+
+    def __init__(self, path, cache_size=1024, statement_cache=64):
+        self.path = path
+        self.cache_size = cache_size
+        self.statement_cache = statement_cache
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def connection(self):
+        """ Returns (connection of this thread, stamp of the database)."""
+        import sqlite3
+
+        stamp = os.stat(self.path).st_mtime_ns
+        if getattr(self.local, 'stamp', None) != stamp:
+            if getattr(self.local, 'connection', None) is not None:
+                self.local.connection.close()
+            uri = 'file:{}?mode=ro'.format(os.path.abspath(self.path))
+            self.local.connection = sqlite3.connect(uri, uri=True, cached_statements=self.statement_cache)
+            self.local.stamp = stamp
+        return self.local.connection, stamp
+
+    def search(self, query, limit=10):
+        match = match_expression(query)
+        if match is None:
+            return []
+        connection, stamp = self.connection()
+        key = (match, limit, stamp)
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                self.hits += 1
+                return self.results[key]
+            self.misses += 1
+
+        results = [{'title': title, 'url': url, 'tags': tags, 'snippet': highlight(snippet)}
+                   for title, url, tags, snippet in connection.execute(SEARCH_SQL, (match, limit))]
+        with self.lock:
+            self.results[key] = results
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+        return results
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.hits = self.misses = 0
+
+
+def make_app(index, allow_origin='*'):
+    """ Returns the WSGI application answering /search with the results of index."""
+
+    def application(environ, start_response):
+        if environ.get('PATH_INFO', '').rstrip('/') != '/search':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        query = params.get('q', [''])[0][:200]
+        try:
+            limit = max(1, min(int(params.get('limit', ['10'])[0]), MAX_LIMIT))
+        except ValueError:
+            limit = 10
+        body = json.dumps({'query': query, 'results': index.search(query, limit)}).encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'application/json; charset=utf-8'),
+            ('Content-Length', str(len(body))),
+            ('Cache-Control', 'public, max-age=60'),
+            ('Access-Control-Allow-Origin', allow_origin),
+        ])
+        return [body]
+
+    return application
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    # The default backlog of 5 makes clients wait for SYN retries under load
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(index, host='127.0.0.1', port=8001, quiet=False):
+    """ Returns a threaded server for index, call serve_forever to start it."""
+    return make_server(host, port, make_app(index), server_class=ThreadingWSGIServer,
+                       handler_class=QuietHandler if quiet else WSGIRequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the search queries from the SQLite index.')
+    parser.add_argument('database', nargs='?', default=os.path.join(ROOT, 'output', 'tipuesearch_content.sqlite'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--cache-size', type=int, default=1024, help='number of results kept in memory')
+    parser.add_argument('--quiet', action='store_true', help='do not log every request')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.database):
+        parser.error('{} does not exist, build the site with TIPUE_SEARCH_SQLITE set'.format(args.database))
+    server = serve(SearchIndex(args.database, args.cache_size), args.host, args.port, args.quiet)
+    print('Serving search on http://{}:{}/search?q='.format(args.host, server.server_port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
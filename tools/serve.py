@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+"""
+Live-reload development server
+==============================
+
+Keeps a warm Pelican instance (plugins registered once, content cache
+enabled) in memory, watches ``content/``, ``theme/`` and ``plugins/`` and
+regenerates only what changed:
+
+* an edited article or page rewrites only its own output file,
+* a template rewrites only the pages rendered with it (templates that are
+  included or extended by others trigger a full write),
+* a file in ``theme/static`` is synced straight into the output,
+* a change in ``plugins/`` restarts the server, since plugin code cannot be
+  reloaded safely in place.
+
+Every served HTML page gets a small script that listens on a Server-Sent
+Events endpoint and reloads the browser as soon as a build finishes. The
+browser acknowledges the reload, which lets the server report the complete
+edit-to-refresh latency.
+
+Usage::
+
+    python -m tools.serve [--port 8000] [--settings settings.py]
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+from tools.sync_static import sync as sync_static
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+WATCHED_FOLDERS = ['content', 'theme', 'plugins']
+IGNORED_SUFFIXES = ('~', '.pyc', '.swp', '.swx', '.tmp')
+
+RELOAD_URL = '/__livereload'
+RELOAD_SCRIPT = """<script>(function () {
+    var last = sessionStorage.getItem('livereload');
+    if (last) {
+        sessionStorage.removeItem('livereload');
+        fetch('%(url)s/ack?build=' + encodeURIComponent(last));
+    }
+    var current = null;
+    var source = new EventSource('%(url)s');
+    source.onmessage = function (event) {
+        var build = JSON.parse(event.data).build;
+        if (current === null) {
+            current = build;
+        } else if (build !== current) {
+            sessionStorage.setItem('livereload', build);
+            location.reload();
+        }
+    };
+})();</script>
+""" % {'url': RELOAD_URL}
+
+
+def snapshot(folders):
+    """ Returns a dictionary {path: (mtime, size)} of all the watched files."""
+    state = {}
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d != '__pycache__']
+            for name in files:
+                if name.startswith('.') or name.endswith(IGNORED_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                state[path] = (st.st_mtime, st.st_size)
+    return state
+
+
+def changed_files(old, new):
+    return sorted(path for path in set(old) | set(new) if old.get(path) != new.get(path))
+
+
+class ReloadState(object):
+    """ Build counter shared between the builder and the HTTP handlers."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # The pid makes build ids unique across restarts of the server
+        self.prefix = '{}-'.format(os.getpid())
+        self.counter = 0
+        self.started = {}
+        self.latencies = []
+
+    @property
+    def build(self):
+        return self.prefix + str(self.counter)
+
+    def notify(self, edit_time):
+        with self.condition:
+            self.counter += 1
+            self.started[self.build] = edit_time
+            self.condition.notify_all()
+
+    def wait(self, build, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.build != build, timeout)
+            return self.build
+
+    def acknowledge(self, build):
+        edit_time = self.started.pop(build, None)
+        if edit_time is None:
+            return
+        latency = (time.time() - edit_time) * 1000
+        self.latencies.append(latency)
+        logger.info('Browser refreshed build {}: edit-to-refresh {:.0f} ms'.format(build, latency))
+
+    def report(self):
+        if not self.latencies:
+            return
+        latencies = sorted(self.latencies)
+        logger.info('Edit-to-refresh over {} reloads: median {:.0f} ms, max {:.0f} ms'.format(
+            len(latencies), latencies[len(latencies) // 2], latencies[-1]))
+
+
+class ReloadHandler(SimpleHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == RELOAD_URL:
+            return self.send_events()
+        if url.path == RELOAD_URL + '/ack':
+            self.state.acknowledge(parse_qs(url.query).get('build', [''])[0])
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        path = self.translate_path(url.path)
+        if os.path.isdir(path) and url.path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if path.endswith('.html') and os.path.isfile(path):
+            return self.send_html(path)
+        return SimpleHTTPRequestHandler.do_GET(self)
+
+    def send_html(self, path):
+        with open(path, 'rb') as f:
+            body = f.read()
+        script = RELOAD_SCRIPT.encode('utf-8')
+        index = body.rfind(b'</body>')
+        body = body[:index] + script + body[index:] if index >= 0 else body + script
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        build = None
+        try:
+            while True:
+                current = self.state.wait(build, timeout=15)
+                if current == build:
+                    # Keeps the connection alive through proxies
+                    self.wfile.write(b': ping\n\n')
+                else:
+                    build = current
+                    self.wfile.write('data: {}\n\n'.format(json.dumps({'build': build})).encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class Builder(object):
+    """ Warm Pelican instance that knows which outputs depend on which file."""
+
+    def __init__(self, settings_file, output_path):
+        from pelican import Pelican, signals
+        from pelican.settings import read_settings
+
+        self.settings = read_settings(settings_file, override={
+            'PATH': os.path.join(ROOT, 'content'),
+            'THEME': os.path.join(ROOT, 'theme'),
+            'OUTPUT_PATH': output_path,
+            'RELATIVE_URLS': True,
+            'DELETE_OUTPUT_DIRECTORY': False,
+            'CACHE_CONTENT': True,
+            'LOAD_CONTENT_CACHE': True,
+            'CONTENT_CACHING_LAYER': 'reader',
+        })
+        self.output_path = output_path
+        self.sources = {}
+        self.templates = {}
+        # None means that every output is written
+        self.selected = None
+
+        signals.all_generators_finalized.connect(self.map_outputs)
+        signals.get_writer.connect(self.get_writer)
+        self.pelican = Pelican(self.settings)
+        # Pelican uses a single writer: SelectiveWriter extends the one of the pass
+        pipeline = sys.modules.get('html_pipeline')
+        if pipeline is not None:
+            signals.get_writer.disconnect(pipeline.get_writer)
+
+    def map_outputs(self, generators):
+        """ Records which source file and which template produce every output."""
+        from pelican.generators import ArticlesGenerator, PagesGenerator
+
+        self.sources = {}
+        self.templates = {src: {dest} for src, dest in self.settings['TEMPLATE_PAGES'].items()}
+        self.templates['index.html'] = {self.settings['INDEX_SAVE_AS']}
+        for generator in generators:
+            if isinstance(generator, ArticlesGenerator):
+                contents = itertools.chain(generator.articles, generator.translations, generator.drafts)
+            elif isinstance(generator, PagesGenerator):
+                contents = itertools.chain(generator.pages, generator.translations, generator.hidden_pages)
+            else:
+                continue
+            for content in contents:
+                self.sources[os.path.realpath(content.source_path)] = content.save_as
+                template = '{}.html'.format(content.template)
+                self.templates.setdefault(template, set()).add(content.save_as)
+
+    def get_writer(self, pelican):
+        from pelican.writers import Writer
+
+        builder = self
+        pipeline = sys.modules.get('html_pipeline')
+        base = pipeline.PipelineWriter if pipeline is not None else Writer
+
+        class SelectiveWriter(base):
+            def write_file(self, name, *args, **kwargs):
+                if builder.selected is not None and name not in builder.selected:
+                    return
+                return super(SelectiveWriter, self).write_file(name, *args, **kwargs)
+
+            def write_feed(self, *args, **kwargs):
+                if builder.selected is not None:
+                    return
+                return super(SelectiveWriter, self).write_feed(*args, **kwargs)
+
+        return SelectiveWriter
+
+    def outputs_for(self, path):
+        """ Returns the outputs affected by ``path``, or None if everything is."""
+        path = os.path.realpath(path)
+        if path in self.sources:
+            return {self.sources[path]}
+        templates_dir = os.path.join(ROOT, 'theme', 'templates')
+        if path.startswith(templates_dir + os.sep):
+            return self.templates.get(os.path.relpath(path, templates_dir))
+        return None
+
+    def build(self, selected=None):
+        self.selected = selected
+        try:
+            self.pelican.run()
+        finally:
+            self.selected = None
+        if selected is None:
+            sync_static(self.output_path)
+
+
+class DevServer(object):
+
+    def __init__(self, settings_file, output_path, port):
+        self.output_path = os.path.realpath(output_path)
+        self.builder = Builder(settings_file, self.output_path)
+        self.state = ReloadState()
+        self.folders = [os.path.join(ROOT, folder) for folder in WATCHED_FOLDERS]
+
+        handler = type('Handler', (ReloadHandler,), {'state': self.state})
+        self.server = ThreadingServer(
+            ('127.0.0.1', port), lambda *args: handler(*args, directory=self.output_path))
+
+    def rebuild(self, paths):
+        edit_time = max(os.stat(p).st_mtime if os.path.exists(p) else time.time() for p in paths)
+        relative = [os.path.relpath(p, ROOT) for p in paths]
+
+        if any(p.startswith('plugins' + os.sep) for p in relative):
+            logger.info('Plugins changed, restarting the server')
+            self.server.server_close()
+            os.execv(sys.executable, [sys.executable, '-m', 'tools.serve'] + sys.argv[1:])
+
+        theme_static = os.path.join('theme', 'static') + os.sep
+        fingerprinted = 'asset_fingerprint' in self.builder.settings['PLUGINS']
+        if all(p.startswith(theme_static) for p in relative) and not fingerprinted:
+            sync_static(self.output_path)
+            selected = set()
+        else:
+            selected = set()
+            for path in paths:
+                outputs = self.builder.outputs_for(path)
+                if outputs is None:
+                    selected = None
+                    break
+                selected |= outputs
+
+        t0 = time.time()
+        if selected != set():
+            self.builder.build(selected)
+        logger.info('Rebuilt {} in {:.0f} ms ({}), edit-to-build {:.0f} ms'.format(
+            ', '.join(relative), (time.time() - t0) * 1000,
+            'full write' if selected is None else '{} output(s)'.format(len(selected)),
+            (time.time() - edit_time) * 1000))
+        self.state.notify(edit_time)
+
+    def serve_forever(self, interval=0.2):
+        t0 = time.time()
+        self.builder.build()
+        logger.info('Initial build in {:.1f} s'.format(time.time() - t0))
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        logger.info('Serving {} at http://{}:{}/'.format(self.output_path, *self.server.server_address))
+
+        state = snapshot(self.folders)
+        try:
+            while True:
+                time.sleep(interval)
+                new_state = snapshot(self.folders)
+                if new_state == state:
+                    continue
+                # Editors often write a file in several steps, wait for them to settle
+                time.sleep(interval / 2)
+                new_state = snapshot(self.folders)
+                paths = changed_files(state, new_state)
+                state = new_state
+                try:
+                    self.rebuild(paths)
+                except Exception:
+                    logger.exception('Build failed')
+        except KeyboardInterrupt:
+            self.state.report()
+            self.server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the website and rebuild it on changes.')
+    parser.add_argument('--settings', default=os.path.join(ROOT, 'settings.py'))
+    parser.add_argument('--output', default=os.path.join(ROOT, 'output'))
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s', datefmt='%H:%M:%S')
+    DevServer(args.settings, args.output, args.port).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Plugin startup benchmark
+========================
+
+Measures what importing each plugin of the ``PLUGINS`` setting costs, on top
+of Pelican itself, using ``python -X importtime``. Every plugin is imported
+in a fresh interpreter right after Pelican, so the time reported is what that
+plugin adds to the start of every build.
+
+    python -m tools.startup_benchmark [--settings settings.py] [--runs 5]
+    python -m tools.startup_benchmark --save before.json
+    python -m tools.startup_benchmark --compare before.json
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+MARKER = 'startup-benchmark-marker'
+# What every build imports anyway before loading the plugins
+BASELINE = 'import pelican, pelican.generators, pelican.readers, pelican.writers'
+
+SCRIPT = """
+import sys
+sys.path.insert(0, {plugin_path!r})
+{baseline}
+sys.stderr.write({marker!r} + '\\n')
+import {plugin}
+"""
+
+
+def import_times(plugin, plugin_path):
+    """ Returns (total microseconds, [(microseconds, module)]) imported by the plugin."""
+    script = SCRIPT.format(plugin_path=plugin_path, baseline=BASELINE, marker=MARKER, plugin=plugin)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True, cwd=ROOT)
+    lines = result.stderr.splitlines()
+    if MARKER not in lines:
+        raise RuntimeError(result.stderr)
+    modules = []
+    for line in lines[lines.index(MARKER) + 1:]:
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_time = int(fields[0])
+        except ValueError:
+            # Header line
+            continue
+        modules.append((self_time, fields[2].strip()))
+    if result.returncode:
+        sys.stderr.write('Importing {} failed, results are partial\n'.format(plugin))
+    return sum(t for t, m in modules), modules
+
+
+def measure(plugins, plugin_path, runs):
+    """ Returns {plugin: {'us': best time of runs, 'modules': count, 'top': heaviest modules}}."""
+    results = {}
+    for plugin in plugins:
+        best = None
+        for _ in range(runs):
+            total, modules = import_times(plugin, plugin_path)
+            if best is None or total < best[0]:
+                best = (total, modules)
+        total, modules = best
+        top = sorted(modules, reverse=True)[:3]
+        results[plugin] = {
+            'us': total,
+            'modules': len(modules),
+            'top': ['{} ({:.1f} ms)'.format(m.strip(), t / 1000) for t, m in top],
+        }
+    return results
+
+
+def print_results(results, previous=None):
+    header = '{:<22} {:>10} {:>8}'.format('plugin', 'import ms', 'modules')
+    if previous:
+        header += ' {:>10}'.format('before ms')
+    print(header + '  heaviest modules')
+    for plugin, result in results.items():
+        line = '{:<22} {:>10.1f} {:>8}'.format(plugin, result['us'] / 1000, result['modules'])
+        if previous:
+            before = previous.get(plugin)
+            line += ' {:>10}'.format('{:.1f}'.format(before['us'] / 1000) if before else '-')
+        print(line + '  ' + ', '.join(result['top']))
+    total = sum(r['us'] for r in results.values()) / 1000
+    line = '{:<22} {:>10.1f}'.format('total', total)
+    if previous:
+        line += ' {:>19.1f}'.format(sum(r['us'] for r in previous.values()) / 1000)
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the Pelican plugins.')
+    parser.add_argument('--settings', default=os.path.join(ROOT, 'settings.py'))
+    parser.add_argument('--runs', type=int, default=5, help='keeps the best of several runs')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare with')
+    args = parser.parse_args()
+
+    settings = runpy.run_path(args.settings)
+    plugin_path = os.path.join(os.path.dirname(os.path.realpath(args.settings)), settings['PLUGIN_PATHS'][0])
+    results = measure(settings['PLUGINS'], plugin_path, args.runs)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+    print_results(results, previous)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
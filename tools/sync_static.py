@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Static files sync
+=================
+
+Replacement for ``cp -r static/* output/static/``. Copies ``static/`` to
+``output/static`` and ``theme/static`` to ``output/theme``, but only the files
+whose content changed since the last sync. Unchanged files keep their mtime,
+so deploy tools only transfer the difference. Files that were synced before
+and no longer exist in the sources are removed from the output.
+
+The state is kept in ``cache/static_manifest.json``::
+
+    python -m tools.sync_static [output]
+"""
+
+from __future__ import unicode_literals
+
+import argparse
+import logging
+import os
+import shutil
+
+from tools.manifest import build_manifest, load_manifest, save_manifest
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# (source folder, destination inside the output folder)
+SYNC_FOLDERS = [
+    ('static', 'static'),
+    ('theme/static', 'theme'),
+]
+
+MANIFEST_PATH = os.path.join(ROOT, 'cache', 'static_manifest.json')
+
+
+def sync(output_path, folders=SYNC_FOLDERS, manifest_path=MANIFEST_PATH):
+    """ Synchronizes the static folders into output_path.
+
+    :returns: tuple (copied, deleted) with the output paths that were touched
+    """
+    state = load_manifest(manifest_path)
+    stat_caches = state.setdefault('sources', {})
+    # What was synced is tracked per output folder, the same sources can feed several
+    synced = state.setdefault('outputs', {}).setdefault(os.path.realpath(output_path), {})
+
+    wanted = {}
+    for src, dst in folders:
+        src_path = os.path.join(ROOT, src)
+        if not os.path.isdir(src_path):
+            continue
+        stat_cache = stat_caches.setdefault(src, {})
+        for path, sha in build_manifest(src_path, stat_cache).items():
+            wanted[dst + '/' + path] = (os.path.join(src_path, path), sha)
+
+    copied = []
+    for out, (src_file, sha) in sorted(wanted.items()):
+        out_file = os.path.join(output_path, out)
+        if synced.get(out) == sha and os.path.isfile(out_file):
+            continue
+        out_dir = os.path.dirname(out_file)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        tmp_file = out_file + '.sync'
+        shutil.copy2(src_file, tmp_file)
+        os.replace(tmp_file, out_file)
+        synced[out] = sha
+        copied.append(out)
+
+    deleted = []
+    for out in sorted(set(synced) - set(wanted)):
+        out_file = os.path.join(output_path, out)
+        if os.path.isfile(out_file):
+            os.remove(out_file)
+            deleted.append(out)
+        del synced[out]
+
+    save_manifest(state, manifest_path)
+    logger.info('Static sync: {} copied, {} deleted, {} unchanged'.format(
+        len(copied), len(deleted), len(wanted) - len(copied)))
+    return copied, deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy changed static files into the output folder.')
+    parser.add_argument('output', nargs='?', default=os.path.join(ROOT, 'output'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sync(args.output)
+
+
+if __name__ == '__main__':
+    main()